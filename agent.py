@@ -0,0 +1,108 @@
+import argparse
+import hmac
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+from host_metrics import collect_snapshot
+from serialization import dumps
+
+# エージェントの待ち受けポート
+AGENT_PORT = 5001
+
+# 監視側との接続を保ったままにする時間（秒）。この間リクエストがなければ切る
+IDLE_TIMEOUT = 300
+
+# 同じスナップショットを使い回す時間（秒）。複数のダッシュボードから同時に来ても収集は1回
+SNAPSHOT_MAX_AGE = 1.0
+
+# 監視側と共有するトークン（空なら認証しない）
+TOKEN_ENV = 'SERVER_MONITOR_AGENT_TOKEN'
+
+
+class SnapshotCache:
+    """エンコード済みのスナップショットを max_age 秒だけ保持する"""
+
+    def __init__(self, max_age=SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self._body = None
+        self._collected_at = 0.0
+        self._lock = threading.Lock()
+
+    def body(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._body is None or now - self._collected_at >= self.max_age:
+                self._body = dumps(collect_snapshot(cpu_interval=None))
+                self._collected_at = now
+            return self._body
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    """GET /metrics にスナップショットのJSONを返す。HTTP/1.1 のキープアライブで接続を使い回す"""
+
+    protocol_version = 'HTTP/1.1'
+    timeout = IDLE_TIMEOUT
+    # ヘッダーと本文が別々に書き込まれるので、Nagle と遅延ACKで約40ms待たされないようにする
+    disable_nagle_algorithm = True
+    cache = None
+    token = ''
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self._send(404, b'{"error":"not found"}')
+            return
+        if self.token and not hmac.compare_digest(self.headers.get('X-Agent-Token', ''), self.token):
+            self._send(403, b'{"error":"forbidden"}')
+            return
+        try:
+            body = self.cache.body()
+        except Exception as e:
+            self._send(500, dumps({'error': str(e)}))
+            return
+        self._send(200, body)
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 監視側から数秒ごとにアクセスされるのでアクセスログは出さない
+        pass
+
+
+class AgentServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_server(host='0.0.0.0', port=AGENT_PORT, token=''):
+    handler = type('Handler', (AgentHandler,), {'cache': SnapshotCache(), 'token': token})
+    return AgentServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='サーバー監視エージェント（監視対象の各ホストで起動する）')
+    parser.add_argument('--host', default='0.0.0.0', help='待ち受けアドレス')
+    parser.add_argument('--port', type=int, default=AGENT_PORT, help='待ち受けポート')
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV, ''),
+                        help=f'監視側と共有するトークン（既定は環境変数 {TOKEN_ENV}）')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.token)
+    print(f'エージェントを起動します: http://{args.host}:{args.port}/metrics')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import http.client
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import AGENT_PORT
+
+
+class AgentError(Exception):
+    pass
+
+
+class AgentPool:
+    """各エージェントへの持続的なHTTP接続を保持する
+
+    ホストごとに1本の接続をキープアライブで使い回すので、サーバーを切り替えても接続確立の待ちがない。
+    使い回した接続が相手側で切られていた場合だけ、新しい接続で1回やり直す。
+    保持する接続数は max_connections で抑え、超えたら最も長く使っていないホストの接続から切る。
+    ポートとトークンは config（監視側の設定 dict）の agent_port / agent_token から読む。
+    """
+
+    def __init__(self, config, timeout=3.0, workers=8, max_connections=512):
+        self.config = config
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._connections = OrderedDict()  # アドレス -> [ロック, HTTPConnection または None]
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='agent-connect')
+
+    def _slot(self, ip):
+        evicted = []
+        with self._lock:
+            slot = self._connections.get(ip)
+            if slot is None:
+                slot = self._connections[ip] = [threading.Lock(), None]
+            else:
+                self._connections.move_to_end(ip)
+            while len(self._connections) > self.max_connections:
+                evicted.append(self._connections.popitem(last=False)[1])
+        for old in evicted:
+            # 使用中なら、使い終わったスレッドが _release で閉じる
+            if old[0].acquire(blocking=False):
+                try:
+                    self._close(old)
+                finally:
+                    old[0].release()
+        return slot
+
+    def _close(self, slot):
+        if slot[1] is not None:
+            slot[1].close()
+            slot[1] = None
+
+    def _release(self, ip, slot):
+        # slot のロックを持った状態で呼ぶ。使っている間に表から外されていたら接続を閉じる
+        with self._lock:
+            evicted = self._connections.get(ip) is not slot
+        if evicted:
+            self._close(slot)
+
+    def _connect(self, ip):
+        connection = http.client.HTTPConnection(ip, self.config.get('agent_port', AGENT_PORT),
+                                                timeout=self.timeout)
+        connection.connect()
+        return connection
+
+    def _request(self, connection):
+        headers = {}
+        if self.config.get('agent_token'):
+            headers['X-Agent-Token'] = self.config['agent_token']
+        connection.request('GET', '/metrics', headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise AgentError(f"エージェントがエラーを返しました（HTTP {response.status}）")
+        return json.loads(body)
+
+    def fetch(self, ip):
+        """ip のエージェントからスナップショットを取得する"""
+        slot = self._slot(ip)
+        with slot[0]:
+            try:
+                reused = slot[1] is not None
+                for attempt in range(2 if reused else 1):
+                    try:
+                        if slot[1] is None:
+                            slot[1] = self._connect(ip)
+                        return self._request(slot[1])
+                    except AgentError:
+                        raise
+                    except (http.client.HTTPException, OSError, ValueError) as e:
+                        self._close(slot)
+                        if attempt == 1 or not reused:
+                            raise AgentError(f"{ip} のエージェントに接続できません: {e}")
+            finally:
+                self._release(ip, slot)
+
+    def warm(self, ips):
+        """まだ接続のないホストへの接続をバックグラウンドで張っておく"""
+        for ip in ips:
+            slot = self._slot(ip)
+            if slot[1] is None:
+                self._executor.submit(self._warm_one, ip, slot)
+
+    def _warm_one(self, ip, slot):
+        with slot[0]:
+            if slot[1] is not None:
+                return
+            try:
+                slot[1] = self._connect(ip)
+            except OSError:
+                pass
+            self._release(ip, slot)
+
+    def discard(self, ip):
+        with self._lock:
+            slot = self._connections.pop(ip, None)
+        if slot is not None:
+            with slot[0]:
+                self._close(slot)
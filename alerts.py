@@ -0,0 +1,320 @@
+import fnmatch
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from serialization import dumps
+
+# ルールファイルが無い場合に使うルール
+DEFAULT_RULES = [
+    {'name': 'CPU使用率が高い', 'metric': 'cpu.total', 'op': '>', 'threshold': 90, 'clear': 80, 'for': 60},
+    {'name': 'メモリ使用率が高い', 'metric': 'memory.percent', 'op': '>', 'threshold': 90, 'clear': 85, 'for': 60},
+    {'name': 'ディスク使用率が高い', 'metric': 'disk.*.percent', 'op': '>', 'threshold': 90, 'clear': 88},
+    {'name': 'ディスク使用率の急増', 'metric': 'disk.*.percent', 'type': 'rate', 'window': 300,
+     'op': '>', 'threshold': 0.05, 'clear': 0.01},
+]
+
+# server_monitor.py のフリート監視用（メトリクス名は host.<IPアドレス>.<項目>）
+FLEET_RULES = [
+    {'name': 'CPU使用率が高い', 'metric': 'host.*.cpu', 'op': '>', 'threshold': 90, 'clear': 80, 'for': 60},
+    {'name': 'メモリ使用率が高い', 'metric': 'host.*.memory', 'op': '>', 'threshold': 90, 'clear': 85, 'for': 60},
+    {'name': 'ディスク使用率が高い', 'metric': 'host.*.disk', 'op': '>', 'threshold': 90, 'clear': 88},
+]
+
+# 通知の上限（件/分）。超えた分は捨てて件数だけ数える
+MAX_NOTIFICATIONS_PER_MINUTE = 30
+
+# /api/alerts で返す直近のイベント数
+RECENT_EVENTS = 100
+
+# これだけサンプルが届かなかったメトリクス（応答しなくなったホスト、外したマウントなど）の状態は捨てる（秒）
+STALE_AFTER = 300
+
+
+class Rule:
+    """1つのアラートルール
+
+    type が 'threshold' なら値そのもの、'rate' なら window 秒間の変化量（毎秒）を threshold と比べる。
+    条件を満たした状態が for 秒続いたら発報し、clear を逆側に越えたら解除する（ヒステリシス）。
+    発報中は repeat 秒ごとに再通知する（0 なら再通知しない）。
+    """
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.pattern = spec['metric']
+        self.type = spec.get('type', 'threshold')
+        if self.type not in ('threshold', 'rate'):
+            raise ValueError(f"不明なルールの種類です: {self.type}")
+        self.op = spec.get('op', '>')
+        if self.op not in ('>', '<'):
+            raise ValueError(f"不明な比較演算子です: {self.op}")
+        self.threshold = float(spec['threshold'])
+        self.clear = float(spec.get('clear', self.threshold))
+        if (self.clear > self.threshold) if self.op == '>' else (self.clear < self.threshold):
+            raise ValueError('clear はしきい値より発報しない側に設定してください')
+        self.hold = float(spec.get('for', 0))
+        self.window = float(spec.get('window', 60))
+        self.repeat = float(spec.get('repeat', 0))
+        self.severity = spec.get('severity', 'warning')
+
+    def matches(self, metric):
+        return fnmatch.fnmatchcase(metric, self.pattern)
+
+    def breached(self, value):
+        return value > self.threshold if self.op == '>' else value < self.threshold
+
+    def cleared(self, value):
+        return value <= self.clear if self.op == '>' else value >= self.clear
+
+
+class RuleState:
+    """ルールとメトリクスの組ごとの状態（保留開始時刻、発報中か、変化量用の直近の値）"""
+
+    __slots__ = ('rule', 'metric', 'pending_since', 'firing', 'fired_at', 'notified_at', 'window')
+
+    def __init__(self, rule, metric):
+        self.rule = rule
+        self.metric = metric
+        self.pending_since = None
+        self.firing = False
+        self.fired_at = None
+        self.notified_at = 0.0
+        self.window = deque() if rule.type == 'rate' else None
+
+    def observe(self, now, value):
+        """新しいサンプルを反映し、通知すべきなら 'firing' / 'resolved' を返す"""
+        rule = self.rule
+        if self.window is not None:
+            window = self.window
+            window.append((now, value))
+            while len(window) > 2 and now - window[1][0] >= rule.window:
+                window.popleft()
+            # window 秒分のサンプルがたまるまでは評価しない
+            if now - window[0][0] < rule.window:
+                return None, None
+            value = (value - window[0][1]) / (now - window[0][0])
+
+        if self.firing:
+            if rule.cleared(value):
+                self.firing = False
+                self.pending_since = None
+                return 'resolved', value
+            if rule.repeat and now - self.notified_at >= rule.repeat:
+                self.notified_at = now
+                return 'firing', value
+            return None, value
+
+        if not rule.breached(value):
+            self.pending_since = None
+            return None, value
+        if self.pending_since is None:
+            self.pending_since = now
+        if now - self.pending_since >= rule.hold:
+            self.firing = True
+            self.fired_at = self.notified_at = now
+            return 'firing', value
+        return None, value
+
+
+class AlertEngine:
+    """サンプルごとにルールを評価し、状態が変わったものだけを通知に回す
+
+    メトリクス名とルールの対応は初めてそのメトリクスを見たときに一度だけ解決するので、
+    1回の評価は届いたメトリクスに対応するルール数ぶんの処理で済み、履歴を読み直すこともない。
+    通知は別スレッドの AlertDispatcher が行うので、サンプリングの周期を遅らせない。
+    stale_after 秒サンプルの届かないメトリクスの状態は捨て、発報中だったものは解除として通知する。
+    """
+
+    def __init__(self, rules, dispatcher=None, stale_after=STALE_AFTER):
+        self.rules = [rule if isinstance(rule, Rule) else Rule(rule) for rule in rules]
+        self.dispatcher = dispatcher
+        self.stale_after = stale_after
+        self._bindings = {}  # メトリクス名 -> [RuleState]
+        self._last_sample = {}  # メトリクス名 -> 最後にサンプルが届いた時刻
+        self._last_sweep = None
+        self._lock = threading.Lock()
+
+    def evaluate(self, now, values):
+        """{メトリクス名: 値} を評価する"""
+        events = []
+        with self._lock:
+            for metric, value in values.items():
+                states = self._bindings.get(metric)
+                if states is None:
+                    states = self._bindings[metric] = [RuleState(rule, metric)
+                                                       for rule in self.rules if rule.matches(metric)]
+                self._last_sample[metric] = now
+                for state in states:
+                    transition, observed = state.observe(now, value)
+                    if transition is not None:
+                        events.append(self._event(now, state, transition, observed))
+            if self._last_sweep is None or now - self._last_sweep >= self.stale_after / 10:
+                self._last_sweep = now
+                events.extend(self._expire(now))
+        if events and self.dispatcher is not None:
+            for event in events:
+                self.dispatcher.submit(event)
+        return events
+
+    def _expire(self, now):
+        # ロックを持った状態で呼ぶ。サンプルの途絶えたメトリクスを捨て、発報中だったものの解除イベントを返す
+        events = []
+        for metric in [metric for metric, last in self._last_sample.items() if now - last >= self.stale_after]:
+            del self._last_sample[metric]
+            for state in self._bindings.pop(metric, []):
+                if state.firing:
+                    events.append(self._event(now, state, 'resolved', None))
+        return events
+
+    def _event(self, now, state, transition, value):
+        rule = state.rule
+        unit = '/秒' if rule.type == 'rate' else ''
+        if value is None:
+            message = f"{rule.name}: {state.metric} のサンプルが {self.stale_after:g} 秒届かないため解除"
+        elif transition == 'firing':
+            message = f"{rule.name}: {state.metric} = {value:.2f}{unit}（しきい値 {rule.op} {rule.threshold:g}{unit}）"
+        else:
+            message = f"{rule.name}: {state.metric} = {value:.2f}{unit} で解除"
+        return {
+            'time': now,
+            'rule': rule.name,
+            'metric': state.metric,
+            'value': round(value, 3) if value is not None else None,
+            'state': transition,
+            'severity': rule.severity,
+            'message': message,
+        }
+
+    def active(self):
+        """発報中のアラートの一覧"""
+        with self._lock:
+            return [{'rule': state.rule.name, 'metric': state.metric, 'severity': state.rule.severity,
+                     'since': state.fired_at}
+                    for states in self._bindings.values() for state in states if state.firing]
+
+
+class FileSink:
+    """1行1イベントのJSONでファイルに追記する"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, event):
+        with open(self.path, 'ab') as f:
+            f.write(dumps(event) + b'\n')
+
+
+class WebhookSink:
+    """イベントをJSONでPOSTする"""
+
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, event):
+        request = urllib.request.Request(self.url, data=dumps(event), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SyslogSink:
+    """syslog に送る（address は '/dev/log' のようなソケットのパスか [ホスト, ポート]）"""
+
+    def __init__(self, address='/dev/log', facility='user'):
+        if isinstance(address, list):
+            address = tuple(address)
+        self.handler = logging.handlers.SysLogHandler(
+            address=address, facility=logging.handlers.SysLogHandler.facility_names[facility])
+        self.handler.ident = 'server-monitor: '
+
+    def send(self, event):
+        level = logging.WARNING if event['state'] == 'firing' else logging.INFO
+        if event['severity'] == 'critical' and event['state'] == 'firing':
+            level = logging.CRITICAL
+        record = logging.LogRecord('alerts', level, __file__, 0, event['message'], None, None)
+        self.handler.emit(record)
+
+
+SINK_TYPES = {
+    'file': lambda spec: FileSink(spec['path']),
+    'webhook': lambda spec: WebhookSink(spec['url'], spec.get('timeout', 5.0)),
+    'syslog': lambda spec: SyslogSink(spec.get('address', '/dev/log'), spec.get('facility', 'user')),
+}
+
+
+class AlertDispatcher:
+    """イベントをキュー経由で受け取り、専用スレッドから各出力先に送る
+
+    通知数は max_per_minute 件/分に制限し、超えた分は捨てて suppressed に数える。
+    直近のイベントは recent に残す（制限で捨てたものも含む）。
+    """
+
+    def __init__(self, sinks, max_per_minute=MAX_NOTIFICATIONS_PER_MINUTE, recent=RECENT_EVENTS):
+        self.sinks = sinks
+        self.max_per_minute = max_per_minute
+        self.recent = deque(maxlen=recent)
+        self.suppressed = 0
+        self._sent = deque()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, event):
+        self.recent.append(event)
+        self._queue.put(event)
+
+    def _allow(self):
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= 60:
+            self._sent.popleft()
+        if len(self._sent) >= self.max_per_minute:
+            return False
+        self._sent.append(now)
+        return True
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if not self._allow():
+                self.suppressed += 1
+                continue
+            for sink in self.sinks:
+                try:
+                    sink.send(event)
+                except Exception as e:
+                    print(f"アラートの送信中にエラーが発生しました（{type(sink).__name__}）: {e}")
+
+
+def load_alerting(path, default_log, default_rules=DEFAULT_RULES):
+    """ルールファイルを読み込んで (AlertEngine, AlertDispatcher) を作る
+
+    ファイルが無ければ default_rules と default_log へのファイル出力を使う。
+    """
+    spec = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                spec = json.load(f)
+        except Exception as e:
+            print(f"アラートルールの読み込み中にエラーが発生しました: {e}")
+    sinks = []
+    for sink in spec.get('sinks', [{'type': 'file', 'path': default_log}]):
+        try:
+            sinks.append(SINK_TYPES[sink['type']](sink))
+        except Exception as e:
+            print(f"アラートの出力先を無視しました（{sink}）: {e}")
+    rules = []
+    for rule in spec.get('rules', default_rules):
+        try:
+            rules.append(Rule(rule))
+        except (KeyError, ValueError) as e:
+            print(f"アラートルールを無視しました（{rule}）: {e}")
+    dispatcher = AlertDispatcher(sinks, spec.get('max_per_minute', MAX_NOTIFICATIONS_PER_MINUTE))
+    return AlertEngine(rules, dispatcher), dispatcher
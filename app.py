@@ -1,17 +1,36 @@
 import os
+import glob
+import atexit
 import time
 import json
 import psutil
+import socket
 import subprocess
-from flask import Flask, render_template, jsonify
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from flask import Flask, render_template, jsonify, request
+from werkzeug.serving import make_server
 from datetime import datetime
 import platform
 
+from alerts import load_alerting
+from cpu_usage import CpuUsage
+from metrics_log import MetricLog
+from metrics_store import MetricStore, downsample
+from mounts import MountTable, UsageProber
+from process_tracker import ProcessTracker
+from serialization import FragmentCache, dumps
+from streaming import SnapshotBroadcaster, event_stream_response
+
 app = Flask(__name__)
 
 # テンプレートディレクトリを作成
 os.makedirs(os.path.join(os.path.dirname(__file__), 'templates'), exist_ok=True)
 
+# CPU使用率の基準値（コレクタはスレッドプールのどのスレッドで動くか決まらないので、スレッドごとの基準値を持つ cpu_percent は使わない）
+cpu_usage = CpuUsage()
+
 # CPU情報の取得
 def get_cpu_info():
     try:
@@ -19,11 +38,13 @@ def get_cpu_info():
         cpu_info['model'] = platform.processor()
         cpu_info['cores'] = psutil.cpu_count(logical=False)
         cpu_info['threads'] = psutil.cpu_count(logical=True)
-        cpu_info['usage_percent'] = psutil.cpu_percent(interval=1)
+        # 前回呼び出しからの差分で算出する（サンプラーが一定間隔で呼ぶのでブロックしない）
+        usage_percent, per_core = cpu_usage.sample()
+        cpu_info['usage_percent'] = usage_percent
         cpu_info['frequency'] = psutil.cpu_freq().current if psutil.cpu_freq() else "N/A"
 
         # 各コアの使用率
-        cpu_info['per_core'] = psutil.cpu_percent(interval=0.1, percpu=True)
+        cpu_info['per_core'] = per_core
 
         return cpu_info
     except Exception as e:
@@ -50,81 +71,400 @@ def get_memory_info():
     except Exception as e:
         return {"error": str(e)}
 
+# 32ビットカウンタの周回を考慮して前回値との差分を求める（リセットされた場合は None）
+def counter_delta(current, previous):
+    if current >= previous:
+        return current - previous
+    if previous < 2**32:
+        return current + 2**32 - previous
+    return None
+
+# 累積カウンタの前回値を保持し、キーごとの毎秒の増加量を求める
+class CounterRates:
+    def __init__(self, fields):
+        self.fields = fields
+        self._last = {}
+
+    def update(self, counters, now=None):
+        # counters は {キー: namedtuple}。初回や時間が進んでいない場合はそのキーを含めない
+        now = time.monotonic() if now is None else now
+        rates = {}
+        for key, value in counters.items():
+            last = self._last.get(key)
+            self._last[key] = (now, value)
+            if last is None or now <= last[0]:
+                continue
+            elapsed = now - last[0]
+            key_rates = {}
+            for field in self.fields:
+                delta = counter_delta(getattr(value, field, 0), getattr(last[1], field, 0))
+                key_rates[field] = None if delta is None else delta / elapsed
+            rates[key] = key_rates
+        # 消えたキーは忘れる
+        for key in [key for key in self._last if key not in counters]:
+            del self._last[key]
+        return rates
+
+# ブロックデバイスのsysfsパス
+BLOCK_ROOT = '/sys/class/block'
+
+# パーティションやdevice-mapperから親のディスク名を求める（sda1 -> sda, dm-0 -> そのスレーブの親）
+_block_parent_cache = {}
+
+def block_parents(name):
+    parents = _block_parent_cache.get(name)
+    if parents is not None:
+        return parents
+    path = os.path.join(BLOCK_ROOT, name)
+    slaves_dir = os.path.join(path, 'slaves')
+    if os.path.exists(os.path.join(path, 'partition')):
+        parents = [os.path.basename(os.path.dirname(os.path.realpath(path)))]
+    elif os.path.isdir(slaves_dir) and os.listdir(slaves_dir):
+        parents = sorted({parent for slave in os.listdir(slaves_dir) for parent in block_parents(slave)})
+    else:
+        parents = [name]
+    _block_parent_cache[name] = parents
+    return parents
+
+# マウント元のデバイスパス（/dev/sda1, /dev/mapper/vg-root など）から親のディスク名を求める
+def device_block_parents(device):
+    if not device.startswith('/dev/'):
+        return []
+    return block_parents(os.path.basename(os.path.realpath(device)))
+
+# マウント一覧のキャッシュ（マウント構成が変わったときだけ取り直す）と、タイムアウト付きの statvfs
+mount_table = MountTable()
+usage_prober = UsageProber(timeout=2.0)
+
 # ディスク情報の取得
 def get_disk_info():
     try:
+        partitions = [p for p in mount_table.partitions()
+                      if not (os.name == 'nt' and ('cdrom' in p.opts or p.fstype == ''))]
+        usages = usage_prober.usages([p.mountpoint for p in partitions])
+
         disk_info = []
-        for partition in psutil.disk_partitions():
-            if os.name == 'nt' and ('cdrom' in partition.opts or partition.fstype == ''):
+        for partition in partitions:
+            usage, stale, error = usages[partition.mountpoint]
+            # 権限のないマウントや、応答せず前回値もないマウントは飛ばす
+            if error is not None or usage is None:
                 continue
-            usage = psutil.disk_usage(partition.mountpoint)
-            disk_info.append({
+            entry = {
                 'device': partition.device,
                 'mountpoint': partition.mountpoint,
                 'fstype': partition.fstype,
                 'total': round(usage.total / (1024**3), 2),  # GB
                 'used': round(usage.used / (1024**3), 2),    # GB
                 'free': round(usage.free / (1024**3), 2),    # GB
-                'percent': usage.percent
-            })
+                'percent': usage.percent,
+                # I/O統計（diskio）と対応付けるための親ディスク名
+                'block_devices': device_block_parents(partition.device)
+            }
+            if stale:
+                # statvfs が応答しないマウント（NFSなど）は前回値を表示する
+                entry['stale'] = True
+            disk_info.append(entry)
 
         return disk_info
     except Exception as e:
         return {"error": str(e)}
 
+# ディスクI/Oの差分計算用
+disk_io_rates = CounterRates(('read_count', 'write_count', 'read_bytes', 'write_bytes',
+                              'read_time', 'write_time', 'busy_time'))
+
+# ディスクI/O情報の取得（ディスク単位のIOPS、スループット、平均待ち時間、使用率）
+def get_disk_io_info():
+    try:
+        counters = psutil.disk_io_counters(perdisk=True)
+        # パーティションは親ディスクに含まれるので、ディスク単位の値だけを対象にする
+        disks = {name: value for name, value in counters.items()
+                 if not name.startswith(('loop', 'ram')) and block_parents(name) == [name]}
+        rates = disk_io_rates.update(disks)
+
+        mountpoints = {}
+        for partition in mount_table.partitions():
+            for parent in device_block_parents(partition.device):
+                mountpoints.setdefault(parent, []).append(partition.mountpoint)
+
+        disk_io_info = {}
+        for name in sorted(disks):
+            rate = rates.get(name)
+            info = {'mountpoints': mountpoints.get(name, [])}
+            if rate is None or None in rate.values():
+                # 初回やカウンタのリセット直後は値を出さない
+                info.update({'iops': None, 'read_iops': None, 'write_iops': None,
+                             'read_bytes': None, 'write_bytes': None,
+                             'await_ms': None, 'util_percent': None})
+            else:
+                ops = rate['read_count'] + rate['write_count']
+                wait = rate['read_time'] + rate['write_time']
+                info.update({
+                    'iops': round(ops, 1),
+                    'read_iops': round(rate['read_count'], 1),
+                    'write_iops': round(rate['write_count'], 1),
+                    'read_bytes': round(rate['read_bytes'], 1),    # バイト/秒
+                    'write_bytes': round(rate['write_bytes'], 1),  # バイト/秒
+                    # I/O 1回あたりの平均待ち時間（ミリ秒）
+                    'await_ms': round(wait / ops, 2) if ops else 0.0,
+                    # busy_time はミリ秒単位の累積なので、1秒あたりの増分から使用率を求める
+                    'util_percent': round(min(rate['busy_time'] / 10.0, 100.0), 1),
+                })
+            disk_io_info[name] = info
+
+        return disk_io_info
+    except Exception as e:
+        return {"error": str(e)}
+
+# sysfs / procfs のパス
+HWMON_ROOT = '/sys/class/hwmon'
+PCI_DEVICES_ROOT = '/sys/bus/pci/devices'
+PROC_MODULES = '/proc/modules'
+PCI_IDS_PATHS = ['/usr/share/misc/pci.ids', '/usr/share/hwdata/pci.ids']
+
+# フォールバックで使う外部コマンドのタイムアウト（秒）
+SUBPROCESS_TIMEOUT = 5
+
+# sysfsのファイルを開いたまま保持し、2回目以降は pread 1回で読み出す
+class SysfsReader:
+    def __init__(self):
+        self._fds = {}
+        self._lock = threading.Lock()
+
+    def read(self, path, size=64):
+        fd = self._fds.get(path)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(path)
+                if fd is None:
+                    fd = os.open(path, os.O_RDONLY)
+                    self._fds[path] = fd
+        try:
+            return os.pread(fd, size, 0).decode('ascii', 'replace').strip()
+        except OSError:
+            # デバイスが消えた場合などはハンドルを捨てて次回開き直す
+            self.forget(path)
+            raise
+
+    def forget(self, path):
+        with self._lock:
+            fd = self._fds.pop(path, None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def close(self):
+        for path in list(self._fds):
+            self.forget(path)
+
+sysfs = SysfsReader()
+
+# 1回だけ読むsysfsファイル（ハンドルはキャッシュしない）
+def read_sysfs_once(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+# チップ名から表示グループへの対応（ここにないチップはチップ名がそのままグループ名になる）
+HWMON_GROUPS = {
+    'k10temp': 'cpu',
+    'k8temp': 'cpu',
+    'coretemp': 'cpu',
+    'zenpower': 'cpu',
+    'cpu_thermal': 'cpu',
+    'nvme': 'nvme',
+}
+
+# hwmonチップ名（sensorsのチップキーは 'k10temp-pci-00c3' のような形式）から表示グループを決める
+def temperature_group(chip_name):
+    base = chip_name.split('-', 1)[0]
+    return HWMON_GROUPS.get(base, base)
+
+# 温度センサーの索引。起動時に全チップを一度だけ探索し、以降は索引済みのファイルだけを読む
+class TemperatureIndex:
+    def __init__(self, root=None):
+        self.root = root
+        self._entries = None
+
+    def discover(self):
+        # (グループ, ラベル, 入力ファイル) の一覧を作る
+        chips = []
+        for chip_dir in sorted(glob.glob(os.path.join(self.root or HWMON_ROOT, 'hwmon*')),
+                               key=lambda d: int(d.rsplit('hwmon', 1)[1] or 0)):
+            chip_name = read_sysfs_once(os.path.join(chip_dir, 'name'))
+            if not chip_name:
+                continue
+            inputs = sorted(glob.glob(os.path.join(chip_dir, 'temp*_input')),
+                            key=lambda p: int(os.path.basename(p)[4:-len('_input')] or 0))
+            if not inputs:
+                continue
+            # 同じグループに複数チップがある場合の区別用（nvme0, coretemp.1 など）
+            device = os.path.join(chip_dir, 'device')
+            chip_id = os.path.basename(os.path.realpath(device)) if os.path.exists(device) else os.path.basename(chip_dir)
+            chips.append((temperature_group(chip_name), chip_id, inputs))
+
+        group_counts = {}
+        for group, _, _ in chips:
+            group_counts[group] = group_counts.get(group, 0) + 1
+
+        entries = []
+        for group, chip_id, inputs in chips:
+            for input_path in inputs:
+                prefix = input_path[:-len('_input')]
+                label = read_sysfs_once(prefix + '_label') or os.path.basename(prefix)
+                if group_counts[group] > 1:
+                    label = f"{chip_id} {label}"
+                entries.append((group, label, input_path))
+        self._entries = entries
+        return entries
+
+    def invalidate(self):
+        self._entries = None
+
+    def __len__(self):
+        return len(self._entries or [])
+
+    def read(self):
+        if self._entries is None:
+            self.discover()
+        temp_info = {}
+        for group, label, input_path in self._entries:
+            try:
+                value = int(sysfs.read(input_path)) / 1000.0
+            except ValueError:
+                continue
+            except OSError:
+                # センサーが消えた（ホットプラグ等）場合は次回に再探索する
+                self.invalidate()
+                continue
+            temp_info.setdefault(group, {})[label] = value
+        return temp_info
+
+temperature_index = TemperatureIndex()
+
 # 温度情報の取得
 def get_temperature_info():
+    try:
+        temp_info = temperature_index.read()
+        # hwmonにセンサーが見つからなければsensorsコマンドにフォールバック
+        if not temp_info and not len(temperature_index):
+            return get_temperature_info_sensors()
+        return temp_info
+    except Exception as e:
+        return {"error": str(e)}
+
+# ロード済みモジュール名からGPUドライバの説明を返す
+def describe_gpu_driver(modules):
+    if 'nvidia' in modules:
+        return 'NVIDIA proprietary driver'
+    elif 'nouveau' in modules:
+        return 'Nouveau open source driver (NVIDIA)'
+    elif 'amdgpu' in modules:
+        return 'AMDGPU open source driver (AMD)'
+    elif 'radeon' in modules:
+        return 'Radeon open source driver (AMD)'
+    return 'Unknown'
+
+# pci.ids からベンダー名・デバイス名を引く（見つからなければIDのまま）
+def lookup_pci_name(vendor_id, device_id):
+    for path in PCI_IDS_PATHS:
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                vendor_name = None
+                for line in f:
+                    if line.startswith('#') or not line.strip():
+                        continue
+                    if not line.startswith('\t'):
+                        if vendor_name is not None:
+                            break
+                        if line[:4].lower() == vendor_id:
+                            vendor_name = line[4:].strip()
+                    elif vendor_name is not None and not line.startswith('\t\t') and line[1:5].lower() == device_id:
+                        return f"{vendor_name} {line[5:].strip()}"
+                if vendor_name is not None:
+                    return f"{vendor_name} Device {device_id}"
+        except OSError:
+            continue
+    return f"Device {vendor_id}:{device_id}"
+
+# GPUの情報取得
+def get_gpu_info():
+    try:
+        if not os.path.isdir(PCI_DEVICES_ROOT):
+            return get_gpu_info_lspci()
+
+        # PCIクラス 0x0300xx（VGA互換コントローラ）のデバイスを探す
+        devices = []
+        drivers = []
+        for dev_dir in sorted(glob.glob(os.path.join(PCI_DEVICES_ROOT, '*'))):
+            pci_class = read_sysfs_once(os.path.join(dev_dir, 'class'))
+            if not pci_class or not pci_class.startswith('0x0300'):
+                continue
+            vendor_id = (read_sysfs_once(os.path.join(dev_dir, 'vendor')) or '')[2:]
+            device_id = (read_sysfs_once(os.path.join(dev_dir, 'device')) or '')[2:]
+            address = os.path.basename(dev_dir)
+            # lspciと同じくドメイン 0000 は省略して表示
+            if address.startswith('0000:'):
+                address = address[5:]
+            devices.append(f"{address} VGA compatible controller: {lookup_pci_name(vendor_id, device_id)}")
+            driver_link = os.path.join(dev_dir, 'driver')
+            if os.path.islink(driver_link):
+                drivers.append(os.path.basename(os.readlink(driver_link)))
+
+        if not devices:
+            return {"error": "GPUが見つかりませんでした"}
+
+        # バインドされたドライバが分からなければ /proc/modules から推定
+        driver = describe_gpu_driver(' '.join(drivers))
+        if driver == 'Unknown':
+            modules = read_sysfs_once(PROC_MODULES) or ''
+            driver = describe_gpu_driver(' '.join(line.split(' ', 1)[0] for line in modules.splitlines()))
+
+        return {
+            'device': '\n'.join(devices),
+            'driver': driver
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+# 温度情報の取得（sensorsコマンド経由、hwmonが読めない環境向けのフォールバック）
+def get_temperature_info_sensors():
     try:
         # sensorsコマンドの出力を取得（エラー出力を破棄）
         try:
-            output = subprocess.check_output(['sensors', '-j'], stderr=subprocess.DEVNULL, universal_newlines=True)
+            output = subprocess.check_output(['sensors', '-j'], stderr=subprocess.DEVNULL, universal_newlines=True, timeout=SUBPROCESS_TIMEOUT)
             sensors_data = json.loads(output)
-        except (subprocess.CalledProcessError, json.JSONDecodeError):
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, json.JSONDecodeError):
             return {"error": "温度情報を取得できませんでした"}
 
-        # 温度データを整形
+        # 温度データを整形（温度系の *_input のみを対象にする）
         temp_info = {}
-
-        # CPUの温度情報
-        if 'k10temp-pci-00c3' in sensors_data:
-            temp_info['cpu'] = {}
-            cpu_data = sensors_data['k10temp-pci-00c3']
-            for key, value in cpu_data.items():
-                if key not in ['Adapter']:
-                    # 値が辞書で、その中に温度値があるか確認
-                    if isinstance(value, dict) and any(k.endswith('_input') for k in value.keys()):
-                        # 最初の *_input 値を取得
-                        for k, v in value.items():
-                            if k.endswith('_input') and isinstance(v, (int, float)):
-                                temp_info['cpu'][key] = v
-                                break
-
-        # NVMeの温度情報
-        nvme_keys = [key for key in sensors_data.keys() if key.startswith('nvme')]
-        if nvme_keys:
-            temp_info['nvme'] = {}
-            for nvme_key in nvme_keys:
-                nvme_data = sensors_data[nvme_key]
-                for key, value in nvme_data.items():
-                    if key not in ['Adapter']:
-                        # 値が辞書で、その中に温度値があるか確認
-                        if isinstance(value, dict) and any(k.endswith('_input') for k in value.keys()):
-                            # 最初の *_input 値を取得
-                            for k, v in value.items():
-                                if k.endswith('_input') and isinstance(v, (int, float)):
-                                    temp_info['nvme'][f"{key}"] = v
-                                    break
+        for chip, chip_data in sensors_data.items():
+            if not isinstance(chip_data, dict):
+                continue
+            group = temperature_group(chip)
+            for key, value in chip_data.items():
+                if not isinstance(value, dict):
+                    continue
+                for k, v in value.items():
+                    if k.startswith('temp') and k.endswith('_input') and isinstance(v, (int, float)):
+                        temp_info.setdefault(group, {})[key] = v
+                        break
 
         return temp_info
     except Exception as e:
         return {"error": str(e)}
 
-# GPUの情報取得
-def get_gpu_info():
+# GPUの情報取得（lspci/lsmod経由、sysfsが読めない環境向けのフォールバック）
+def get_gpu_info_lspci():
     try:
         # nvidiaの場合はnvidia-smi、AMDの場合はradeontopなどを使用
         # ここではlspciの出力を解析してGPU情報を表示
-        output = subprocess.check_output('lspci | grep -i vga', shell=True, universal_newlines=True)
+        output = subprocess.check_output('lspci | grep -i vga', shell=True, universal_newlines=True, timeout=SUBPROCESS_TIMEOUT)
 
         gpu_info = {
             'device': output.strip(),
@@ -133,16 +473,8 @@ def get_gpu_info():
 
         # 可能であればドライバ情報も追加（glxinfoエラーを無視）
         try:
-            driver_output = subprocess.check_output('lsmod | grep -E "nvidia|nouveau|amdgpu|radeon"', shell=True, stderr=subprocess.DEVNULL, universal_newlines=True)
-
-            if 'nvidia' in driver_output:
-                gpu_info['driver'] = 'NVIDIA proprietary driver'
-            elif 'nouveau' in driver_output:
-                gpu_info['driver'] = 'Nouveau open source driver (NVIDIA)'
-            elif 'amdgpu' in driver_output:
-                gpu_info['driver'] = 'AMDGPU open source driver (AMD)'
-            elif 'radeon' in driver_output:
-                gpu_info['driver'] = 'Radeon open source driver (AMD)'
+            driver_output = subprocess.check_output('lsmod | grep -E "nvidia|nouveau|amdgpu|radeon"', shell=True, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=SUBPROCESS_TIMEOUT)
+            gpu_info['driver'] = describe_gpu_driver(driver_output)
         except:
             # ドライバ情報の取得に失敗した場合は無視
             pass
@@ -151,6 +483,22 @@ def get_gpu_info():
     except Exception as e:
         return {"error": str(e)}
 
+# NIC別の送受信速度の計算用
+net_rates = CounterRates(('bytes_recv', 'bytes_sent', 'packets_recv', 'packets_sent',
+                          'errin', 'errout', 'dropin', 'dropout'))
+
+# ネットワーク速度の表示名（psutilのフィールド名 -> API上の名前、いずれも毎秒）
+NET_RATE_NAMES = {
+    'bytes_recv': 'rx_bytes',
+    'bytes_sent': 'tx_bytes',
+    'packets_recv': 'rx_packets',
+    'packets_sent': 'tx_packets',
+    'errin': 'rx_errors',
+    'errout': 'tx_errors',
+    'dropin': 'rx_drops',
+    'dropout': 'tx_drops',
+}
+
 # ネットワーク情報
 def get_network_info():
     try:
@@ -159,6 +507,7 @@ def get_network_info():
         # ネットワークインターフェース情報
         net_io = psutil.net_io_counters(pernic=True)
         net_addrs = psutil.net_if_addrs()
+        rates = net_rates.update(net_io)
 
         for nic, addrs in net_addrs.items():
             if nic in net_io:
@@ -171,10 +520,14 @@ def get_network_info():
                         'type': addr_type
                     })
 
+                nic_rates = rates.get(nic, {})
                 network_info[nic] = {
                     'addresses': addr_info,
                     'sent': round(net_io[nic].bytes_sent / (1024**2), 2),  # MB
-                    'received': round(net_io[nic].bytes_recv / (1024**2), 2)  # MB
+                    'received': round(net_io[nic].bytes_recv / (1024**2), 2),  # MB
+                    # 前回収集からの毎秒の値（初回やカウンタのリセット直後は None）
+                    'rates': {name: None if nic_rates.get(field) is None else round(nic_rates[field], 2)
+                              for field, name in NET_RATE_NAMES.items()}
                 }
 
         return network_info
@@ -203,38 +556,417 @@ def get_system_info():
     except Exception as e:
         return {"error": str(e)}
 
+# プロセス表（サンプル間でProcessオブジェクトを保持してCPU使用率の差分を正しく取る）
+process_tracker = ProcessTracker()
+
 # プロセス情報の取得
 def get_process_info():
     try:
-        processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'username', 'memory_percent', 'cpu_percent']):
-            try:
-                pinfo = proc.info
-                pinfo['memory_percent'] = round(pinfo['memory_percent'], 2)
-                processes.append(pinfo)
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-        
-        # CPU使用率でソート
-        processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-        return processes[:20]  # 上位20プロセスだけ返す
+        return process_tracker.top(20)  # 上位20プロセスだけ返す
     except Exception as e:
         return {"error": str(e)}
 
-# すべての情報を取得
-def get_all_info():
+# GPUの構成を左右するもの（読み込まれたカーネルモジュールの名前とPCIデバイス数）
+def gpu_hardware_signature():
+    try:
+        with open(PROC_MODULES) as f:
+            modules = frozenset(line.split(' ', 1)[0] for line in f)
+    except OSError:
+        modules = None
+    try:
+        devices = len(os.listdir(PCI_DEVICES_ROOT))
+    except OSError:
+        devices = None
+    return modules, devices
+
+# 収集対象、更新間隔（秒）、タイムアウト（秒）
+# 更新間隔 None は起動時に一度だけ収集し、以降は refresh() で再収集する
+COLLECTORS = [
+    ('system', get_system_info, 60, 2),
+    ('cpu', get_cpu_info, 1, 2),
+    ('memory', get_memory_info, 2, 2),
+    ('disk', get_disk_info, 30, 5),
+    ('diskio', get_disk_io_info, 2, 2),
+    ('temperature', get_temperature_info, 1, 2),
+    ('gpu', get_gpu_info, None, 10),
+    ('network', get_network_info, 2, 2),
+    ('processes', get_process_info, 2, 3),
+]
+
+# サンプラーの基本周期（秒）
+SAMPLE_INTERVAL = 1.0
+
+# 失敗が続くコレクタのバックオフ上限（秒）
+MAX_BACKOFF = 300
+
+# コレクタを並列実行するスレッド数
+COLLECTOR_WORKERS = 4
+
+# 個々のコレクタの状態（次回実行時刻、連続失敗回数、実行中の処理）
+class CollectorState:
+    def __init__(self, name, func, interval, timeout):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.next_due = 0.0
+        self.failures = 0
+        self.pending = None
+
+    def is_due(self, now):
+        # 前回の実行がまだ終わっていなければ重ねて実行しない
+        return self.pending is None and self.next_due is not None and now >= self.next_due
+
+    def schedule(self, now, failed):
+        if failed:
+            # 失敗が続くほど間隔を倍々に広げる
+            self.failures += 1
+            base = self.interval or SAMPLE_INTERVAL * 10
+            self.next_due = now + min(base * (2 ** self.failures), MAX_BACKOFF)
+        else:
+            self.failures = 0
+            self.next_due = None if self.interval is None else now + self.interval
+
+# バックグラウンドでメトリクスを収集し、最新のスナップショットを保持する
+class MetricSampler:
+    def __init__(self, collectors=COLLECTORS, interval=SAMPLE_INTERVAL, workers=COLLECTOR_WORKERS):
+        self.interval = interval
+        self.workers = workers
+        self._collectors = [CollectorState(*collector) for collector in collectors]
+        # 起動ごとに変わる識別子（再起動をまたいだ版数の取り違えを防ぐ）
+        self.instance = os.urandom(6).hex()
+        self._listeners = []
+        self._executor = None
+        self._snapshot = None
+        # スナップショットの版数と、各セクションが最後に変化した版数
+        self._version = 0
+        self._section_versions = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='collector')
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='metric-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+            executor, self._executor = self._executor, None
+        if thread is not None:
+            thread.join()
+        if executor is not None:
+            # 固まったコレクタを待たずに終了する
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self, timeout=None):
+        # 未起動なら起動し、初回サンプルが揃うまでだけ待つ（最長でもコレクタのタイムアウトまで）
+        if self._thread is None:
+            self.start()
+        if timeout is None:
+            timeout = max(state.timeout for state in self._collectors) + self.interval
+        self._ready.wait(timeout)
+        return self._snapshot or {}
+
+    def add_listener(self, listener):
+        # 各周期の後に listener(snapshot, updated) を呼ぶ（updated はこの周期に更新された項目名）
+        self._listeners.append(listener)
+
+    def refresh(self, name):
+        # 指定したコレクタを次の周期で再収集させる（構成変更時など）
+        for state in self._collectors:
+            if state.name == name:
+                state.next_due = 0.0
+                return True
+        return False
+
+    def collect_due(self):
+        # 実行時刻になったコレクタをスレッドプールで並列に実行し、新しいスナップショットを組み立てる
+        # （周期のずれで1周期取りこぼさないよう、半周期分の余裕を持たせて判定する）
+        now = time.monotonic() + self.interval / 2
+        previous = self._snapshot or {}
+        snapshot = {'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+        started = time.monotonic()
+        for state in self._collectors:
+            if state.is_due(now):
+                state.pending = (self._executor.submit(state.func), started + state.timeout)
+
+        stale = []
+        updated = []
+        for state in self._collectors:
+            result = previous.get(state.name, {})
+            if state.pending is not None:
+                future, deadline = state.pending
+                try:
+                    # 期限までに終わらなければ前回値を stale として返す（処理自体は裏で続行）
+                    result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FuturesTimeoutError:
+                    stale.append(state.name)
+                    snapshot[state.name] = result
+                    continue
+                except Exception as e:
+                    result = {"error": str(e)}
+                state.pending = None
+                # 期限後に返ってきた結果も使うが、遅延として失敗扱いにしてバックオフする
+                failed = _has_error(result)
+                finished = time.monotonic()
+                state.schedule(finished, failed or finished > deadline)
+                # 失敗時でも過去に成功した値があればそれを残す
+                if failed and state.name in previous and not _has_error(previous[state.name]):
+                    result = previous[state.name]
+                elif not failed:
+                    updated.append(state.name)
+            snapshot[state.name] = result
+
+        snapshot['stale'] = stale
+
+        # 内容が変わったセクションがあれば版数を進め、そのセクションに新しい版数を記録する
+        # （変わらなかったセクションは前回と同じオブジェクトを使い、エンコード済みの断片を再利用させる）
+        changed = []
+        for name in self.sections():
+            if name in previous and snapshot.get(name) == previous[name]:
+                snapshot[name] = previous[name]
+            else:
+                changed.append(name)
+        if changed:
+            self._version += 1
+            section_versions = dict(self._section_versions)
+            for name in changed:
+                section_versions[name] = self._version
+            self._section_versions = section_versions
+        snapshot['version'] = self._version
+
+        # スナップショットは丸ごと差し替える（読み手はロック不要）
+        self._snapshot = snapshot
+        return snapshot, updated
+
+    def sections(self):
+        return [state.name for state in self._collectors] + ['stale']
+
+    def changes_since(self, version):
+        # 指定した版数より後に変化したセクションだけを返す
+        snapshot = self.snapshot()
+        section_versions = self._section_versions
+        changed = {name: snapshot[name] for name in self.sections()
+                   if name in snapshot and section_versions.get(name, 0) > version}
+        return snapshot, changed
+
+    def _run(self):
+        # 初回は基準値からの差分が取れるよう少し待ってから収集
+        self._stop.wait(0.1)
+        while not self._stop.is_set():
+            started = time.monotonic()
+            snapshot, updated = self.collect_due()
+            self._ready.set()
+            for listener in self._listeners:
+                try:
+                    listener(snapshot, updated)
+                except Exception as e:
+                    print(f"サンプル後処理中にエラーが発生しました: {e}")
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(0.0, self.interval - elapsed))
+
+def _has_error(section):
+    return isinstance(section, dict) and 'error' in section
+
+# 収集プロセスが公開したスナップショットを読む、MetricSampler と同じ読み出し口を持つ複製
+# （serve.py のワーカーで使う。収集は行わず、公開された状態が変わったときだけ読み直す）
+class SnapshotReplica:
+    def __init__(self, channel, poll_interval=0.1):
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.instance = None
+        self.alerts = {'active': [], 'recent': [], 'suppressed': 0}
+        self._sections = []
+        self._listeners = []
+        self._snapshot = None
+        self._section_versions = {}
+        self._token = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshot-replica', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self, timeout=None):
+        if self._thread is None:
+            self.start()
+        self._ready.wait(SAMPLE_INTERVAL * 15 if timeout is None else timeout)
+        return self._snapshot or {}
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def refresh(self, name):
+        # 再収集は収集プロセスの仕事なので、ワーカーからは要求できない
+        return False
+
+    def sections(self):
+        return self._sections
+
+    def changes_since(self, version):
+        snapshot = self.snapshot()
+        section_versions = self._section_versions
+        changed = {name: snapshot[name] for name in self.sections()
+                   if name in snapshot and section_versions.get(name, 0) > version}
+        return snapshot, changed
+
+    def poll(self):
+        # 公開された状態が変わっていれば取り込み、(snapshot, updated) を返す（変わっていなければ None）
+        self._token, state = self.channel.read(self._token)
+        if state is None:
+            return None
+        previous = self._snapshot or {}
+        snapshot = state['snapshot']
+        section_versions = state['section_versions']
+        # 版数が変わっていないセクションは前回のオブジェクトを使い、エンコード済みの断片を再利用させる
+        for name in state['sections']:
+            if name in previous and section_versions.get(name) == self._section_versions.get(name):
+                snapshot[name] = previous[name]
+        self.instance = state['instance']
+        self._sections = state['sections']
+        self.alerts = state['alerts']
+        self._section_versions = section_versions
+        self._snapshot = snapshot
+        self._ready.set()
+        return snapshot, state['updated']
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                result = self.poll()
+            except Exception as e:
+                print(f"スナップショットの読み込み中にエラーが発生しました: {e}")
+                result = None
+            if result is not None:
+                for listener in self._listeners:
+                    try:
+                        listener(*result)
+                    except Exception as e:
+                        print(f"サンプル後処理中にエラーが発生しました: {e}")
+            self._stop.wait(self.poll_interval)
+
+sampler = MetricSampler()
+
+# 履歴（1秒×10分、10秒×24時間、5分×30日の3段で集計して保持）
+history = MetricStore()
+
+# 再起動後も履歴を参照できるよう、サンプルをディスクにも追記する（日ごとのセグメント、30日保持）
+METRICS_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics_log')
+metric_log = MetricLog(METRICS_LOG_DIR)
+atexit.register(metric_log.close)
+
+# スナップショットから履歴に記録するメトリクスを取り出す（この周期に更新された項目のみ）
+def snapshot_metrics(snapshot, updated, now):
+    values = {}
+    if 'cpu' in updated:
+        cpu = snapshot['cpu']
+        values['cpu.total'] = cpu['usage_percent']
+        for i, percent in enumerate(cpu.get('per_core', [])):
+            values[f'cpu.core{i}'] = percent
+    if 'memory' in updated:
+        values['memory.percent'] = snapshot['memory']['percent']
+        values['swap.percent'] = snapshot['memory']['swap_percent']
+    if 'network' in updated:
+        # NIC別の速度（毎秒）。リンク飽和のグラフ用に履歴へ残す
+        for nic, info in snapshot['network'].items():
+            for name, rate in info['rates'].items():
+                if rate is not None:
+                    values[f'net.{nic}.{name}'] = rate
+    if 'disk' in updated and isinstance(snapshot['disk'], list):
+        for disk in snapshot['disk']:
+            values[f"disk.{disk['mountpoint']}.percent"] = disk['percent']
+    if 'diskio' in updated:
+        for name, info in snapshot['diskio'].items():
+            for field in ('iops', 'read_bytes', 'write_bytes', 'await_ms', 'util_percent'):
+                if info[field] is not None:
+                    values[f'diskio.{name}.{field}'] = info[field]
+    return values
+
+# アラートのルール（無ければ既定のルールで alerts.log に出力）
+ALERT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_rules.json')
+ALERT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alerts.log')
+alert_engine, alert_dispatcher = load_alerting(ALERT_RULES_FILE, ALERT_LOG)
+
+# サンプルごとに履歴へ記録し、同じ値でアラートを評価する（serve.py では収集プロセスだけが行う）
+def record_history(snapshot, updated):
+    now = time.time()
+    values = snapshot_metrics(snapshot, updated, now)
+    if values:
+        history.record(now, values)
+        metric_log.append(now, values)
+        alert_engine.evaluate(now, values)
+
+def alert_state():
     return {
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'system': get_system_info(),
-        'cpu': get_cpu_info(),
-        'memory': get_memory_info(),
-        'disk': get_disk_info(),
-        'temperature': get_temperature_info(),
-        'gpu': get_gpu_info(),
-        'network': get_network_info(),
-        'processes': get_process_info()
+        'active': alert_engine.active(),
+        'recent': list(alert_dispatcher.recent),
+        'suppressed': alert_dispatcher.suppressed
     }
 
+sampler.add_listener(record_history)
+
+# システム情報の周期（60秒）ごとにGPUの構成が変わっていないか調べ、変わっていれば（後から読み込まれたドライバや
+# 抜き差しされたデバイス）GPU情報を再収集させる
+gpu_hardware = gpu_hardware_signature()
+
+def watch_gpu_hardware(snapshot, updated):
+    global gpu_hardware
+    if 'system' not in updated:
+        return
+    signature = gpu_hardware_signature()
+    if signature != gpu_hardware:
+        gpu_hardware = signature
+        sampler.refresh('gpu')
+
+sampler.add_listener(watch_gpu_hardware)
+
+# セクションごとのエンコード済みJSON断片（変化していないセクションは再エンコードしない）
+section_cache = FragmentCache()
+
+def encode_snapshot(snapshot, extra=None):
+    return section_cache.encode_object(snapshot, extra)
+
+def json_response(body, status=200):
+    return app.response_class(body, status=status, mimetype='application/json')
+
+# 周期ごとのスナップショットを購読中のダッシュボードへプッシュ配信する
+broadcaster = SnapshotBroadcaster(encoder=lambda snapshot: b'data: ' + encode_snapshot(snapshot) + b'\n\n')
+
+def publish_snapshot(snapshot, updated):
+    if updated:
+        broadcaster.publish(snapshot)
+
+sampler.add_listener(publish_snapshot)
+
+# すべての情報を取得（最新のスナップショットを返す）
+def get_all_info():
+    return sampler.snapshot()
+
+# スナップショットの特定セクションを取得
+def get_section(name):
+    return get_all_info().get(name, {})
+
+# スナップショットの特定セクションをエンコード済みのJSONで返す
+def section_response(name):
+    return json_response(section_cache.fragment(name, get_section(name)))
+
 # ルートページ
 @app.route('/')
 def index():
@@ -243,47 +975,236 @@ def index():
 # APIルート - すべての情報を取得
 @app.route('/api/all')
 def api_all():
-    return jsonify(get_all_info())
+    # since（前回受け取った版数）と instance が指定されていれば、変化したセクションだけを返す
+    since = request.args.get('since', type=int)
+    instance = request.args.get('instance')
+    snapshot = get_all_info()
+    version = snapshot.get('version', 0)
+    instance_id = sampler.instance
+    etag = f'{instance_id}-{version}'
+
+    same_instance = instance == instance_id
+    if request.if_none_match.contains(etag) or (same_instance and since == version):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    if since is None:
+        response = json_response(encode_snapshot(snapshot, {'instance': instance_id}))
+    else:
+        # 再起動後や未来の版数が来た場合は全セクションを返す
+        full = not same_instance or since > version
+        snapshot, changed = sampler.changes_since(-1 if full else since)
+        response = json_response(b''.join([
+            b'{"instance":', dumps(instance_id),
+            b',"version":', dumps(snapshot.get('version', 0)),
+            b',"timestamp":', dumps(snapshot.get('timestamp')),
+            b',"full":', dumps(full),
+            b',"changed":', encode_snapshot(changed),
+            b'}'
+        ]))
+    response.set_etag(f"{instance_id}-{snapshot.get('version', 0)}")
+    return response
+
+# APIルート - スナップショットをServer-Sent Eventsで配信
+@app.route('/api/stream')
+def api_stream():
+    # サンプラーが未起動なら起動する
+    get_all_info()
+    return event_stream_response(broadcaster)
+
+# APIルート - メトリクスの履歴を取得
+@app.route('/api/history')
+def api_history():
+    # ワーカーは履歴を持たないので、収集プロセスに同じ問い合わせをしてそのまま返す
+    if history_address is not None:
+        return forward_history()
+    metric = request.args.get('metric')
+    if not metric:
+        # メトリクス名が無ければ記録中のメトリクス一覧を返す（サンプラーが未起動なら起動する）
+        get_all_info()
+        return jsonify({'metrics': sorted(set(history.metrics()) | set(metric_log.metrics()))})
+    since = request.args.get('since', type=float)
+    until = request.args.get('until', type=float)
+    points = request.args.get('points', type=int)
+    limit = request.args.get('limit', type=int)
+    # メモリ上の履歴が since まで届かない（再起動直後など）場合は、届かない範囲だけディスクのログから読む
+    requested = request.args.get('source')
+    source = requested
+    if source is None:
+        oldest = history.oldest(metric)
+        source = 'disk' if since is not None and (oldest is None or oldest > since) else 'memory'
+    if source == 'disk':
+        # source=disk と指定されたときはメモリ上の履歴を使わずログだけを読む
+        source, resolution, times, columns = query_history_log(metric, since, until, points, requested is None)
+    else:
+        result = history.query(metric, since, until, points, limit)
+        if result is None:
+            return jsonify({'error': f'メトリクス {metric} は記録されていません'}), 404
+        resolution, times, columns = result
+    if limit is not None:
+        times = times[-limit:]
+        columns = {field: values[-limit:] for field, values in columns.items()}
+    return jsonify({
+        'metric': metric,
+        'source': source,
+        'resolution': resolution,
+        'timestamps': times,
+        'values': [round(v, 2) for v in columns['avg']],
+        'min': [round(v, 2) for v in columns['min']],
+        'max': [round(v, 2) for v in columns['max']],
+        'last': [round(v, 2) for v in columns['last']]
+    })
+
+# ディスクのログを読む問い合わせで points を省略したときの点数の上限
+HISTORY_POINTS = 1000
+
+def query_history_log(metric, since, until, points, use_memory):
+    """ディスクのログを含めて履歴を読み、(読んだ場所, 解像度, 時刻リスト, {列名: 値リスト}) を返す
+
+    ログはメモリ上の段と同じ解像度で集計して読む。use_memory ならメモリ上の最も古いサンプル以降のバケットは
+    メモリから読み、ログはそれより古い範囲だけを読む。点数が points を超えたらまとめ直す。
+    """
+    end = until if until is not None else time.time()
+    if since is None:
+        since = end - metric_log.retention_seconds
+    points = points or HISTORY_POINTS
+    width = history.resolution(since, end, points)
+    oldest = history.oldest(metric) if use_memory else None
+    # メモリから読むのは、最も古いサンプル以降に始まるバケット（開始時刻が split 以降）だけ
+    split = max(-(-oldest // width) * width, since + width) if oldest is not None else end + width
+    times, columns = metric_log.query(metric, since, min(end, split - width), width)
+    source = 'disk'
+    if split <= end:
+        result = history.query(metric, split - width, until, width=width)
+        if result is not None:
+            _, memory_times, memory_columns = result
+            times = times + memory_times
+            columns = {field: values + memory_columns[field] for field, values in columns.items()}
+            source = 'disk+memory'
+    resolution, times, columns = downsample(width, times, columns, points)
+    return source, resolution, times, columns
+
+# APIルート - 発報中のアラートと直近のイベントを取得
+@app.route('/api/alerts')
+def api_alerts():
+    # サンプラーが未起動なら起動する
+    get_all_info()
+    # ワーカーでは収集プロセスが評価した結果を返す
+    if isinstance(sampler, SnapshotReplica):
+        return jsonify(sampler.alerts)
+    return jsonify(alert_state())
 
 # APIルート - CPUの情報を取得
 @app.route('/api/cpu')
 def api_cpu():
-    return jsonify(get_cpu_info())
+    return section_response('cpu')
 
 # APIルート - メモリ情報を取得
 @app.route('/api/memory')
 def api_memory():
-    return jsonify(get_memory_info())
+    return section_response('memory')
 
 # APIルート - ディスク情報を取得
 @app.route('/api/disk')
 def api_disk():
-    return jsonify(get_disk_info())
+    return section_response('disk')
+
+# APIルート - ディスクI/O情報を取得
+@app.route('/api/diskio')
+def api_diskio():
+    return section_response('diskio')
 
 # APIルート - 温度情報を取得
 @app.route('/api/temperature')
 def api_temperature():
-    return jsonify(get_temperature_info())
+    return section_response('temperature')
 
 # APIルート - GPU情報を取得
 @app.route('/api/gpu')
 def api_gpu():
-    return jsonify(get_gpu_info())
+    return section_response('gpu')
 
 # APIルート - ネットワーク情報を取得
 @app.route('/api/network')
 def api_network():
-    return jsonify(get_network_info())
+    return section_response('network')
 
 # APIルート - システム情報を取得
 @app.route('/api/system')
 def api_system():
-    return jsonify(get_system_info())
+    return section_response('system')
 
 # APIルート - プロセス情報を取得
 @app.route('/api/processes')
 def api_processes():
-    return jsonify(get_process_info())
+    return section_response('processes')
+
+# serve.py から呼ばれるフック
+# 収集プロセスだけがサンプラーを動かし、周期ごとの状態を channel でワーカーに公開する。
+# 履歴も収集プロセスだけが持ち、history_address（Unixソケット）で /api/history に答える
+history_address = None
+history_server = None
+
+def start_collector(channel, address):
+    global history_server
+    history_server = make_server('unix://' + address, 0, app, threaded=True)
+    threading.Thread(target=history_server.serve_forever, name='history-server', daemon=True).start()
+
+    def share(snapshot, updated):
+        channel.publish(b''.join([
+            b'{"instance":', dumps(sampler.instance),
+            b',"sections":', dumps(sampler.sections()),
+            b',"section_versions":', dumps(sampler._section_versions),
+            b',"updated":', dumps(updated),
+            b',"alerts":', dumps(alert_state()),
+            b',"snapshot":', encode_snapshot(snapshot),
+            b'}'
+        ]))
+    sampler.add_listener(share)
+    sampler.start()
+
+def stop_collector():
+    history_server.shutdown()
+    sampler.stop()
+    metric_log.close()
+
+# ワーカーは収集せず、公開された状態の複製から応答する
+def attach_worker(channel, address):
+    global sampler, history_address
+    history_address = address
+    sampler = SnapshotReplica(channel)
+    sampler.add_listener(publish_snapshot)
+    sampler.start()
+
+# Unixソケット越しのHTTP接続
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=10.0):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.unix_path)
+        self.sock = sock
+
+def forward_history():
+    connection = UnixHTTPConnection(history_address)
+    try:
+        connection.request('GET', request.full_path)
+        response = connection.getresponse()
+        return app.response_class(response.read(), status=response.status,
+                                  mimetype=response.getheader('Content-Type', 'application/json'))
+    except OSError as e:
+        return jsonify({'error': f'履歴を取得できませんでした: {e}'}), 503
+    finally:
+        connection.close()
+
+def stop_worker():
+    # 配信中のストリームを終わらせ、処理中のリクエストだけを待てるようにする
+    sampler.stop()
+    broadcaster.close()
 
 # メインエントリポイント
 if __name__ == '__main__':
@@ -292,6 +1213,10 @@ if __name__ == '__main__':
     
     print('サーバー監視アプリを起動します...')
     print('ブラウザで http://localhost:5000 にアクセスしてください')
-    
+
+    # メトリクス収集スレッドを起動（リローダーの親プロセスでは起動しない）
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        sampler.start()
+
     # 0.0.0.0でリッスンすることで外部からアクセス可能にする
     app.run(host='0.0.0.0', port=5000, debug=True)
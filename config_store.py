@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import threading
+
+
+def atomic_write(path, data):
+    """同じディレクトリの一時ファイルに書いてから置き換える（途中で落ちても元のファイルは壊れない）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        # mkstemp は 0600 で作るので、元のファイル（無ければ umask に従った既定）の権限に合わせる
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehind:
+    """変更の通知を受けて、専用スレッドから delay 秒後にまとめて書き出す
+
+    delay 秒の間に来た変更は1回の書き込みにまとまる。呼び出し側はディスクI/Oを待たない。
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def schedule(self):
+        self._dirty.set()
+
+    def flush(self):
+        """未書き出しの変更をその場で書き出す（終了時用）"""
+        with self._write_lock:
+            self._dirty.clear()
+            try:
+                self._write()
+            except Exception as e:
+                print(f"{type(self).__name__} の書き出し中にエラーが発生しました: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._dirty.wait()
+            # 続けて来る変更をまとめるために少し待つ
+            self._stop.wait(self.delay)
+            self.flush()
+
+    def _write(self):
+        raise NotImplementedError
+
+
+class ConfigWriter(WriteBehind):
+    """設定の dict を JSON ファイルに書き出す"""
+
+    def __init__(self, path, config, delay=1.0):
+        self.path = path
+        self.config = config
+        super().__init__(delay)
+
+    def _write(self):
+        # dict のコピーは GIL の下で一度に行われるので、書き換え中の dict を走査しない
+        data = json.dumps(dict(self.config), indent=2, ensure_ascii=False).encode('utf-8')
+        atomic_write(self.path, data)
+
+
+class HostJournal(WriteBehind):
+    """ホスト表の変更を1行1件のJSONとして追記するストア
+
+    変更のあったホストだけを追記し（削除は {"ip": ..., "deleted": true}）、
+    行数が生きているホスト数に比べて増えすぎたら一時ファイル経由で詰め直す。
+    最終応答時刻だけの変化は seen_precision 秒以上進んだときにしか書かない。
+    """
+
+    def __init__(self, path, delay=2.0, seen_precision=3600):
+        self.path = path
+        self.seen_precision = seen_precision
+        self._pending = {}  # アドレス -> 書き出すホスト情報（削除なら None）
+        self._written = {}  # アドレス -> ファイルに書いた最新のホスト情報
+        self._lines = 0
+        self._lock = threading.Lock()
+        super().__init__(delay)
+
+    def load(self):
+        """ファイルを先頭から再生してホストの一覧を返す"""
+        hosts = {}
+        lines = 0
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は読み飛ばす
+                        continue
+                    lines += 1
+                    if record.get('deleted'):
+                        hosts.pop(record['ip'], None)
+                    else:
+                        hosts[record['ip']] = record
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._written = dict(hosts)
+            self._lines = lines
+        return list(hosts.values())
+
+    def record(self, ip, host):
+        """ホストの変更（削除なら host=None）を書き出し待ちに入れる"""
+        with self._lock:
+            written = self._written.get(ip)
+            if host is not None and written is not None and self._same(written, host):
+                self._pending.pop(ip, None)
+                return
+            self._pending[ip] = dict(host) if host is not None else None
+        self.schedule()
+
+    def _same(self, written, host):
+        for key, value in host.items():
+            if key == 'last_seen':
+                if value - written.get('last_seen', 0) >= self.seen_precision:
+                    return False
+            elif written.get(key) != value:
+                return False
+        return True
+
+    def _write(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            for ip, host in pending.items():
+                if host is None:
+                    self._written.pop(ip, None)
+                else:
+                    self._written[ip] = host
+            compact = self._lines + len(pending) > 2 * len(self._written) + 100
+            hosts = list(self._written.values()) if compact else None
+        try:
+            lines = self._store(pending, hosts)
+        except BaseException:
+            # 書けなかった変更は次の書き出しでやり直す（その間に来た新しい変更を優先）
+            with self._lock:
+                for ip, host in pending.items():
+                    self._pending.setdefault(ip, host)
+                    self._written.pop(ip, None)
+            self.schedule()
+            raise
+        with self._lock:
+            self._lines = lines
+
+    def _store(self, pending, hosts):
+        """hosts が渡されたら詰め直し、そうでなければ変更分だけ追記する。書いた後の行数を返す"""
+        if hosts is not None:
+            data = b''.join(json.dumps(host, ensure_ascii=False).encode('utf-8') + b'\n' for host in hosts)
+            atomic_write(self.path, data)
+            return len(hosts)
+        with open(self.path, 'ab') as f:
+            for ip, host in pending.items():
+                record = host if host is not None else {'ip': ip, 'deleted': True}
+                f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return self._lines + len(pending)
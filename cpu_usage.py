@@ -0,0 +1,48 @@
+import threading
+import time
+
+import psutil
+
+
+def _busy_percent(previous, current):
+    def split(times):
+        # guest / guest_nice は user / nice に含まれているので二重に数えない（Linux）
+        total = sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+        idle = times.idle + getattr(times, 'iowait', 0)
+        return total - idle, total
+
+    busy_before, total_before = split(previous)
+    busy_after, total_after = split(current)
+    total = total_after - total_before
+    if total <= 0:
+        return 0.0
+    return round(min(max((busy_after - busy_before) / total * 100, 0.0), 100.0), 1)
+
+
+class CpuUsage:
+    """cpu_times() の前回値との差分からCPU使用率（%）を求める
+
+    psutil.cpu_percent(interval=None) は基準値を呼び出したスレッドごとに持つため、
+    スレッドプールやリクエストごとのスレッドから呼ぶと初回は 0.0 になり、区間もスレッドごとにずれる。
+    こちらは基準値を1つだけ持ち、どのスレッドから呼んでも前回の計算からの使用率を返す。
+    前回の計算から min_interval 秒経っていなければ、短すぎる区間で測らずに前回の結果を返す。
+    """
+
+    def __init__(self, min_interval=0.5):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last = (time.monotonic(), psutil.cpu_times(), psutil.cpu_times(percpu=True))
+        self._result = None
+
+    def sample(self):
+        """(全体の使用率, コア別の使用率のリスト) を返す"""
+        with self._lock:
+            now = time.monotonic()
+            if self._result is not None and now - self._last[0] < self.min_interval:
+                return self._result
+            total, per_cpu = psutil.cpu_times(), psutil.cpu_times(percpu=True)
+            _, last_total, last_per_cpu = self._last
+            self._last = (now, total, per_cpu)
+            self._result = (_busy_percent(last_total, total),
+                            [_busy_percent(before, after) for before, after in zip(last_per_cpu, per_cpu)])
+            return self._result
@@ -0,0 +1,260 @@
+import itertools
+import socket
+import threading
+import time
+
+from netscan import (DEFAULT_RATE, DEFAULT_TIMEOUT, count_targets, iter_targets, local_addresses,
+                     local_networks, parse_networks, scan_hosts)
+
+# 既知のホストを確認し直す間隔（秒）
+KNOWN_INTERVAL = 30
+
+# 範囲全体をスキャンし直す間隔（秒）
+FULL_INTERVAL = 3600
+
+# これだけ応答がなかったホストは表から消す（秒）
+FORGET_AFTER = 7 * 86400
+
+
+def detect_local_ip():
+    """外向きの通信に使われるIPアドレス"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # この接続は実際には確立されない
+        s.connect(('10.255.255.255', 1))
+        return s.getsockname()[0]
+    except Exception:
+        return '127.0.0.1'
+    finally:
+        s.close()
+
+
+def ip_key(ip):
+    return socket.inet_aton(ip)
+
+
+class HostTable:
+    """見つかったホストの表（IPアドレス -> 最終応答時刻などの情報）
+
+    一覧は変更後に初めて読まれたときだけ作り直し、読み出し側は同じリストを共有する
+    （スキャン中に応答が続いても、応答ごとに並べ直したりはしない）。
+    listener を渡すと、ホストが変わるたびに listener(アドレス, ホスト情報) を呼ぶ（削除時は None）。
+    """
+
+    def __init__(self, forget_after=FORGET_AFTER, listener=None):
+        self.forget_after = forget_after
+        self.listener = listener
+        self._hosts = {}
+        self._view = None
+        self._lock = threading.Lock()
+
+    def load(self, servers):
+        """保存済みの一覧を読み込む（前回応答したホストは次の確認まで応答あり扱い）"""
+        with self._lock:
+            for server in servers:
+                if 'ip' not in server:
+                    continue
+                host = {'ip': server['ip'], 'hostname': server.get('hostname', server['ip']),
+                        'is_local': server.get('is_local', False), 'online': server.get('online', True),
+                        'last_seen': server.get('last_seen', 0)}
+                self._hosts[server['ip']] = host
+            self._invalidate()
+
+    def _changed(self, ip):
+        if self.listener is not None:
+            host = self._hosts.get(ip)
+            self.listener(ip, dict(host) if host is not None else None)
+
+    def _invalidate(self):
+        # ロックを持った状態で呼ぶ。一覧は次に servers() が呼ばれたときに作り直す
+        self._view = None
+
+    def servers(self):
+        """一覧（ローカルが先頭、残りはアドレス順）。呼び出し側は書き換えないこと"""
+        with self._lock:
+            if self._view is None:
+                hosts = sorted(self._hosts.values(), key=lambda host: (not host['is_local'], ip_key(host['ip'])))
+                self._view = [dict(host) for host in hosts]
+            return self._view
+
+    def get(self, ip):
+        with self._lock:
+            host = self._hosts.get(ip)
+            return dict(host) if host is not None else None
+
+    def remote_ips(self):
+        with self._lock:
+            return [ip for ip, host in self._hosts.items() if not host['is_local']]
+
+    def set_local(self, ip, hostname):
+        with self._lock:
+            for host in self._hosts.values():
+                if host['is_local'] and host['ip'] != ip:
+                    host['is_local'] = False
+                    self._changed(host['ip'])
+            self._hosts[ip] = {'ip': ip, 'hostname': hostname, 'is_local': True,
+                               'online': True, 'last_seen': time.time()}
+            self._changed(ip)
+            self._invalidate()
+
+    def seen(self, ip, hostname=None, now=None):
+        """応答のあったホストを記録する"""
+        now = time.time() if now is None else now
+        with self._lock:
+            host = self._hosts.get(ip)
+            if host is None:
+                host = self._hosts[ip] = {'ip': ip, 'hostname': hostname or ip, 'is_local': False}
+            elif hostname:
+                host['hostname'] = hostname
+            host['online'] = True
+            host['last_seen'] = now
+            self._changed(ip)
+            self._invalidate()
+
+    def set_hostname(self, ip, hostname):
+        with self._lock:
+            host = self._hosts.get(ip)
+            if host is not None and hostname and host['hostname'] != hostname:
+                host['hostname'] = hostname
+                self._changed(ip)
+                self._invalidate()
+
+    def finish_round(self, probed, alive, now=None):
+        """確認したのに応答がなかったホストを応答なしにし、長く応答のないホストを消す"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for ip in probed:
+                host = self._hosts.get(ip)
+                if host is not None and ip not in alive and not host['is_local'] and host['online']:
+                    host['online'] = False
+                    self._changed(ip)
+            for ip in [ip for ip, host in self._hosts.items()
+                       if not host['is_local'] and now - host['last_seen'] > self.forget_after]:
+                del self._hosts[ip]
+                self._changed(ip)
+            self._invalidate()
+
+
+class ScanManager:
+    """スキャンを1本に絞って実行する
+
+    既知のホストは KNOWN_INTERVAL ごとに確認し直し、範囲全体は FULL_INTERVAL ごとにしか回さない。
+    実行中に来たスキャン要求は実行中のスキャンにまとめる（範囲全体の実行中に来た要求は何もしない。
+    既知ホストだけの確認中に範囲全体の要求が来たら、終わった直後に1回だけ範囲全体を回す）。
+    """
+
+    def __init__(self, table, resolver, config, on_change=None,
+                 known_interval=KNOWN_INTERVAL, full_interval=FULL_INTERVAL):
+        self.table = table
+        self.resolver = resolver
+        self.config = config
+        self.on_change = on_change
+        self.known_interval = known_interval
+        self.full_interval = full_interval
+        self.status = {'scanning': False, 'full': False, 'networks': [], 'total': 0,
+                       'probed': 0, 'alive': 0, 'last_full': None, 'last_known': None}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._want_full = False
+        self._want_known = False
+        self._stop = threading.Event()
+
+    def start(self):
+        """定期確認のスレッドを起動する（最初は範囲全体）"""
+        threading.Thread(target=self._periodic, name='scan-scheduler', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _periodic(self):
+        while not self._stop.is_set():
+            last_full = self.status['last_full']
+            self.request(full=last_full is None or time.time() - last_full >= self.full_interval)
+            self._stop.wait(self.known_interval)
+
+    def request(self, full=True):
+        """スキャンを要求する。実行中なら実行中のものにまとめ、現在の状態を返す"""
+        with self._lock:
+            running_full = self.status['scanning'] and self.status['full']
+            if full and not running_full:
+                self._want_full = True
+            elif not full and not self.status['scanning']:
+                self._want_known = True
+            if self._thread is None:
+                full = self._take()
+                if full is not None:
+                    self._thread = threading.Thread(target=self._drain, args=(full,), name='scan', daemon=True)
+                    self._thread.start()
+            return dict(self.status)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.status)
+
+    def _take(self):
+        # ロックを持った状態で呼ぶ。次に回すスキャンの種類（範囲全体なら True）を決め、実行中にする
+        if not (self._want_full or self._want_known):
+            return None
+        # 一度も範囲全体を回していなければ既知ホストの確認だけでは済ませない
+        full = self._want_full or self.status['last_full'] is None
+        self._want_full = self._want_known = False
+        self.status.update(scanning=True, full=full, probed=0, alive=0)
+        return full
+
+    def _drain(self, full):
+        while True:
+            try:
+                self._scan(full)
+            except Exception as e:
+                print(f"ネットワークスキャン中にエラーが発生しました: {e}")
+            with self._lock:
+                self.status['scanning'] = False
+                full = self._take()
+                if full is None:
+                    self._thread = None
+                    return
+
+    def _scan(self, full):
+        local_ip = detect_local_ip()
+        self.table.set_local(local_ip, socket.gethostname())
+        known = self.table.remote_ips()
+
+        targets = iter(known)
+        networks = []
+        total = len(known)
+        if full:
+            networks, invalid = parse_networks(self.config.get('scan_networks', []))
+            for cidr in invalid:
+                print(f"無効なスキャン対象を無視しました: {cidr}")
+            networks += local_networks()
+            exclude = local_addresses() | {local_ip} | set(known)
+            # 既知のホストを先に確認してから範囲全体を回す
+            targets = itertools.chain(targets, iter_targets(networks, exclude=exclude))
+            total += count_targets(networks)
+        with self._lock:
+            self.status.update(networks=[str(n) for n in networks], total=total)
+
+        def counted(addresses):
+            for ip in addresses:
+                self.status['probed'] += 1
+                yield ip
+
+        alive = set()
+
+        def on_alive(ip):
+            # 応答した時点で表に載せ、ホスト名は逆引きが終わりしだい埋める
+            alive.add(ip)
+            self.status['alive'] += 1
+            self.table.seen(ip, self.resolver.cached(ip))
+            self.resolver.resolve(ip, lambda ip, hostname: self.table.set_hostname(ip, hostname))
+
+        scan_hosts(counted(targets), on_alive=on_alive,
+                   timeout=self.config.get('scan_timeout', DEFAULT_TIMEOUT),
+                   rate=self.config.get('scan_rate', DEFAULT_RATE))
+        self.table.finish_round(known, alive)
+        with self._lock:
+            self.status['last_full' if full else 'last_known'] = time.time()
+            if full:
+                self.status['last_known'] = self.status['last_full']
+        if self.on_change is not None:
+            self.on_change()
@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from host_metrics import collect_resources
+from serialization import dumps
+
+# 全ホストの取得を繰り返す間隔（秒）
+FLEET_INTERVAL = 5
+
+# 同時に取得するホスト数の上限
+FLEET_CONCURRENCY = 64
+
+# ワースト一覧に載せるホスト数
+WORST_N = 10
+
+# 集計する項目
+FLEET_METRICS = ('cpu', 'memory', 'disk')
+
+
+def percentile(sorted_values, q):
+    """ソート済みの値の q パーセンタイル（最近傍順位法）"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(resources):
+    """リソース情報から CPU・メモリ・最も埋まっているディスクの使用率を取り出す"""
+    disks = [disk for disk in resources.get('disk', []) if not disk.get('stale')]
+    fullest = max(disks, key=lambda disk: disk['percent'], default=None)
+    return {
+        'cpu': resources['cpu']['percent'],
+        'memory': resources['memory']['percent'],
+        'disk': fullest['percent'] if fullest else None,
+        'disk_mountpoint': fullest['mountpoint'] if fullest else None,
+    }
+
+
+def aggregate(hosts, worst_n=WORST_N):
+    """ホストごとの要約から、項目ごとのパーセンタイルとワースト一覧を作る"""
+    summary = {}
+    for metric in FLEET_METRICS:
+        values = [(host[metric], host['ip']) for host in hosts if host.get(metric) is not None]
+        ordered = sorted(value for value, _ in values)
+        summary[metric] = {
+            'p50': percentile(ordered, 50),
+            'p90': percentile(ordered, 90),
+            'p99': percentile(ordered, 99),
+            'max': ordered[-1] if ordered else None,
+            'avg': round(sum(ordered) / len(ordered), 1) if ordered else None,
+            'worst': [{'ip': ip, 'value': value}
+                      for value, ip in sorted(values, reverse=True)[:worst_n]],
+        }
+    return summary
+
+
+class FleetPoller:
+    """既知の全ホストのエージェントから定期的に取得し、集計結果をエンコード済みで保持する
+
+    専用スレッドから、ダッシュボードと共用の AgentPool（ホストごとのキープアライブ接続）で並列に取得する。
+    同時に取得するホスト数は concurrency で抑える。ローカルホストはリソース情報だけを直接集める。
+    集計結果は1周期に1回だけJSONにエンコードするので、/api/fleet は保持しているバイト列を返すだけで済む。
+    listener を渡すと集計のたびに listener(集計結果) を呼ぶ。
+    """
+
+    def __init__(self, table, agent_pool, interval=FLEET_INTERVAL, concurrency=FLEET_CONCURRENCY,
+                 listener=None):
+        self.table = table
+        self.agent_pool = agent_pool
+        self.listener = listener
+        self.interval = interval
+        self.concurrency = concurrency
+        self.body = dumps({'time': None, 'hosts': [], 'summary': aggregate([])})
+        self._executor = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='fleet-fetch')
+                self._thread = threading.Thread(target=self._run, name='fleet-poller', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"フリート情報の取得中にエラーが発生しました: {e}")
+            time.sleep(max(0.0, started + self.interval - time.monotonic()))
+
+    def poll_once(self):
+        servers = self.table.servers()
+        results = list(self._executor.map(self._poll, servers))
+        fleet = {'time': time.time(), 'hosts': results, 'summary': aggregate(results)}
+        self.body = dumps(fleet)
+        if self.listener is not None:
+            self.listener(fleet)
+        return fleet
+
+    def _poll(self, server):
+        host = {'ip': server['ip'], 'hostname': server['hostname'], 'is_local': server['is_local'],
+                'online': server['online'], 'cpu': None, 'memory': None, 'disk': None,
+                'disk_mountpoint': None, 'error': None}
+        if not server['online']:
+            host['error'] = '応答なし'
+            return host
+        hostname = None
+        try:
+            if server['is_local']:
+                resources = collect_resources(cpu_interval=None)
+            else:
+                snapshot = self.agent_pool.fetch(server['ip'])
+                resources = snapshot['resources']
+                hostname = snapshot.get('system_info', {}).get('hostname')
+            summary = summarize(resources)
+        except Exception as e:
+            host['error'] = str(e) or type(e).__name__
+            return host
+        if hostname and host['hostname'] == host['ip']:
+            host['hostname'] = hostname
+        host.update(summary)
+        return host
@@ -0,0 +1,102 @@
+import datetime
+import platform
+import socket
+import time
+
+import psutil
+
+from cpu_usage import CpuUsage
+from mounts import MountTable, UsageProber
+from process_tracker import ProcessTracker
+
+# server_monitor.py（ローカル監視）とエージェントの両方で使う収集処理
+
+process_tracker = ProcessTracker()
+# エージェントはリクエストごとに別スレッドで収集するので、基準値を1つだけ持つ CpuUsage を使う
+cpu_usage = CpuUsage()
+mount_table = MountTable()
+usage_prober = UsageProber(timeout=2.0)
+
+
+def collect_system_info():
+    # システム情報
+    return {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'system': platform.system(),
+        'release': platform.release(),
+        'version': platform.version(),
+        'processor': platform.processor(),
+        'uptime': get_uptime(),
+    }
+
+
+def collect_resources(cpu_interval=1):
+    # リソース情報（CPU、メモリ、ディスク）
+    memory = psutil.virtual_memory()
+    return {
+        'cpu': {
+            # cpu_interval 秒測るか、None なら前回の収集からの使用率
+            'percent': psutil.cpu_percent(interval=cpu_interval) if cpu_interval else cpu_usage.sample()[0],
+            'count': psutil.cpu_count(),
+            'freq': psutil.cpu_freq().current if psutil.cpu_freq() else 'N/A',
+        },
+        'memory': {
+            'total': format_bytes(memory.total),
+            'available': format_bytes(memory.available),
+            'used': format_bytes(memory.used),
+            'percent': memory.percent,
+        },
+        'disk': get_disk_info(),
+        'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def collect_snapshot(cpu_interval=None):
+    """ダッシュボード1回分の情報（システム情報、リソース、上位プロセス）"""
+    return {
+        'system_info': collect_system_info(),
+        'resources': collect_resources(cpu_interval=cpu_interval),
+        'processes': process_tracker.top(20, max_age=1.0),
+    }
+
+
+def get_uptime():
+    # システム起動時間を計算
+    uptime_seconds = int(time.time() - psutil.boot_time())
+    days, remainder = divmod(uptime_seconds, 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{days}日 {hours}時間 {minutes}分 {seconds}秒"
+
+
+def format_bytes(bytes):
+    # バイト数を人間が読みやすい形式に変換
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if bytes < 1024.0:
+            return f"{bytes:.2f} {unit}"
+        bytes /= 1024.0
+    return f"{bytes:.2f} PB"
+
+
+def get_disk_info():
+    # ディスク情報を取得（マウント一覧はキャッシュし、statvfs はタイムアウト付きで実行）
+    disk_info = []
+    partitions = mount_table.partitions()
+    usages = usage_prober.usages([p.mountpoint for p in partitions])
+    for partition in partitions:
+        usage, stale, error = usages[partition.mountpoint]
+        if error is not None or usage is None:
+            # 一部のファイルシステムはエラーを起こすことがある
+            continue
+        disk_info.append({
+            'device': partition.device,
+            'mountpoint': partition.mountpoint,
+            'fstype': partition.fstype,
+            'total': format_bytes(usage.total),
+            'used': format_bytes(usage.used),
+            'free': format_bytes(usage.free),
+            'percent': usage.percent,
+            'stale': stale
+        })
+    return disk_info
@@ -0,0 +1,206 @@
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+from urllib.parse import quote, unquote
+
+from metrics_store import ROLLUP_FIELDS
+
+# 1レコード = 時刻(double) + 値(double) の固定長16バイト
+RECORD = struct.Struct('<dd')
+
+
+class MetricLog:
+    """メトリクスを追記専用の固定長バイナリセグメントに保存するログ
+
+    メトリクスごとのディレクトリに、開始時刻を名前にしたセグメントファイルを作る。
+    読み出しはセグメントをmmapしてdouble配列として扱うので解析処理もコピーも不要。
+    クラッシュで途中まで書かれた末尾レコードは、ファイルサイズだけを見て切り詰める。
+    idle_close 秒書き込みのないメトリクスのファイルは閉じる（次に書くときに開き直す）。
+    """
+
+    def __init__(self, directory, segment_seconds=86400, retention_seconds=30 * 86400, flush_interval=5.0,
+                 idle_close=300.0):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_seconds
+        self.flush_interval = flush_interval
+        self.idle_close = idle_close
+        self._pending = {}   # メトリクス名 -> 未書き込みのレコード列
+        self._active = {}    # メトリクス名 -> (セグメント開始時刻, ファイル)
+        self._last_write = {}  # メトリクス名 -> 最後に書き込んだ時刻（time.monotonic）
+        self._last_flush = time.monotonic()
+        self._last_retention = 0.0
+        self._lock = threading.Lock()
+
+    def _metric_dir(self, name):
+        return os.path.join(self.directory, quote(name, safe=''))
+
+    def _segment_path(self, name, segment_start):
+        return os.path.join(self._metric_dir(name), f'{int(segment_start)}.seg')
+
+    def append(self, timestamp, values):
+        """{メトリクス名: 値} をバッファに積み、一定間隔ごとにまとめて書き込む"""
+        with self._lock:
+            for name, value in values.items():
+                self._pending.setdefault(name, []).append((timestamp, value))
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            now = time.monotonic()
+            for name, records in pending.items():
+                for timestamp, value in records:
+                    self._file_for(name, timestamp).write(RECORD.pack(timestamp, value))
+                self._last_write[name] = now
+            for _, f in self._active.values():
+                f.flush()
+            # 書き込みの途絶えたメトリクス（消えたNICなど）のファイルは閉じる
+            for name in [name for name in self._active if now - self._last_write.get(name, now) >= self.idle_close]:
+                self._active.pop(name)[1].close()
+                self._last_write.pop(name, None)
+        if time.time() - self._last_retention >= 3600:
+            self.enforce_retention()
+
+    def _file_for(self, name, timestamp):
+        # 区切り時刻を過ぎたら新しいセグメントに切り替える
+        segment_start = timestamp - timestamp % self.segment_seconds
+        active = self._active.get(name)
+        if active is not None and active[0] == segment_start:
+            return active[1]
+        if active is not None:
+            active[1].close()
+        path = self._segment_path(name, segment_start)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._recover(path)
+        f = open(path, 'ab')
+        self._active[name] = (segment_start, f)
+        return f
+
+    @staticmethod
+    def _recover(path):
+        # 末尾の書きかけレコードを切り詰める（中身は読まずにサイズだけで判定）
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size % RECORD.size:
+            os.truncate(path, size - size % RECORD.size)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for _, f in self._active.values():
+                f.close()
+            self._active.clear()
+            self._last_write.clear()
+
+    def enforce_retention(self):
+        """保持期間を過ぎたセグメントを削除し、セグメントが無くなったメトリクスのディレクトリも消す"""
+        self._last_retention = time.time()
+        cutoff = time.time() - self.retention_seconds
+        for path in glob.glob(os.path.join(self.directory, '*', '*.seg')):
+            segment_start = float(os.path.basename(path)[:-len('.seg')])
+            if segment_start + self.segment_seconds < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if not os.path.isdir(self.directory):
+            return
+        # 空になったディレクトリを消す。書き込み中のものは残す（rmdir は中身が残っていれば失敗する）
+        with self._lock:
+            active = {quote(name, safe='') for name in self._active}
+            for entry in set(os.listdir(self.directory)) - active:
+                try:
+                    os.rmdir(os.path.join(self.directory, entry))
+                except OSError:
+                    pass
+
+    def metrics(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(entry) for entry in os.listdir(self.directory))
+
+    def _segments(self, name, since, until):
+        paths = []
+        for path in glob.glob(os.path.join(self._metric_dir(name), '*.seg')):
+            segment_start = float(os.path.basename(path)[:-len('.seg')])
+            if since is not None and segment_start + self.segment_seconds <= since:
+                continue
+            if until is not None and segment_start > until:
+                continue
+            paths.append((segment_start, path))
+        return [path for _, path in sorted(paths)]
+
+    def query(self, name, since=None, until=None, width=1):
+        """width 秒ごとに集計した点を (時刻リスト, {列名: 値リスト}) で返す
+
+        時刻はバケットの開始時刻（width の倍数）で、開始時刻が since より後かつ until 以前のバケットを返す（MetricStore と同じ）。
+        各バケットの min/max/avg/last は、バケットの区間内のレコードから求める。
+        """
+        self.flush()
+        # バケットの区間に含まれるレコードの範囲 [low, high)
+        low = None if since is None else since - since % width + width
+        high = None if until is None else until - until % width + width
+        times = []
+        columns = {field: [] for field in ROLLUP_FIELDS}
+        sums, counts = [], []
+        views = []
+        try:
+            for path in self._segments(name, low, high):
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    size -= size % RECORD.size
+                    if not size:
+                        continue
+                    mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                # mmap上のレコードをそのまま [時刻, 値, 時刻, 値, ...] のdouble配列として見る
+                data = memoryview(mapped).cast('d')
+                views.append((mapped, data))
+                first = 0 if low is None else _first_after(data, low, inclusive=True)
+                last = len(data) // 2 if high is None else _first_after(data, high, inclusive=True)
+                while first < last:
+                    timestamp = data[2 * first]
+                    start = timestamp - timestamp % width
+                    end = min(_first_after(data, start + width, inclusive=True), last)
+                    # バケット1つ分の値を配列のスライスとしてまとめて取り出す
+                    values = data[2 * first + 1:2 * end:2].tolist()
+                    if times and times[-1] == start:
+                        # セグメントの境目をまたいだバケット
+                        columns['min'][-1] = min(columns['min'][-1], min(values))
+                        columns['max'][-1] = max(columns['max'][-1], max(values))
+                        columns['last'][-1] = values[-1]
+                        sums[-1] += sum(values)
+                        counts[-1] += len(values)
+                    else:
+                        times.append(start)
+                        columns['min'].append(min(values))
+                        columns['max'].append(max(values))
+                        columns['last'].append(values[-1])
+                        sums.append(sum(values))
+                        counts.append(len(values))
+                    first = end
+            columns['avg'] = [total / count for total, count in zip(sums, counts)]
+            return times, columns
+        finally:
+            for mapped, data in views:
+                data.release()
+                mapped.close()
+
+
+def _first_after(data, timestamp, inclusive=False):
+    # レコードは時刻順に追記されるので二分探索で timestamp より新しい（inclusive なら timestamp 以降の）最初の位置を求める
+    lo, hi = 0, len(data) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if data[2 * mid] < timestamp or (not inclusive and data[2 * mid] == timestamp):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
@@ -0,0 +1,279 @@
+import threading
+import time
+from array import array
+
+
+class RingBuffer:
+    """固定長の配列で時系列を保持するリングバッファ
+
+    追加は O(1)。メモリ使用量は容量で頭打ちになり、古い点から上書きされる。
+    配列は点がたまるにつれて倍々に確保するので、点の少ない系列は容量ぶんのメモリを使わない。
+    fields ごとに float32 の列を持つ。
+    """
+
+    def __init__(self, capacity, fields=('value',), initial=64):
+        self.capacity = capacity
+        self.fields = fields
+        allocated = min(capacity, initial)
+        self._times = array('d', bytes(8 * allocated))
+        self._columns = [array('f', bytes(4 * allocated)) for _ in fields]
+        self._start = 0
+        self._size = 0
+
+    def _grow(self):
+        # 一周するまでは先頭から詰めて書くので、末尾に足すだけでよい
+        extra = min(len(self._times), self.capacity - len(self._times))
+        self._times.extend(array('d', bytes(8 * extra)))
+        for column in self._columns:
+            column.extend(array('f', bytes(4 * extra)))
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, *values):
+        if self._size == len(self._times) < self.capacity:
+            self._grow()
+        index = (self._start + self._size) % self.capacity
+        self._times[index] = timestamp
+        for column, value in zip(self._columns, values):
+            column[index] = value
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def oldest(self):
+        return self._times[self._start] if self._size else None
+
+    def _time_at(self, i):
+        return self._times[(self._start + i) % self.capacity]
+
+    def _first_after(self, since):
+        # 時刻順に並んでいるので二分探索で since より新しい最初の点を探す
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._time_at(mid) <= since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _segments(self, first, last):
+        # 論理位置 [first, last) を物理配列上の最大2区間に分ける
+        if first >= last:
+            return []
+        a = (self._start + first) % self.capacity
+        b = (self._start + last - 1) % self.capacity + 1
+        if a < b:
+            return [(a, b)]
+        return [(a, self.capacity), (0, b)]
+
+    def query(self, since=None, until=None, limit=None):
+        """[since, until] の範囲の点を (時刻リスト, {列名: 値リスト}) で返す。limit は新しい方から数える"""
+        first = 0 if since is None else self._first_after(since)
+        last = self._size if until is None else self._first_after(until)
+        if limit is not None:
+            first = max(first, last - limit)
+        times = []
+        columns = {field: [] for field in self.fields}
+        # バッファ全体はコピーせず、必要な区間だけをmemoryview経由で取り出す
+        times_view = memoryview(self._times)
+        column_views = [memoryview(column) for column in self._columns]
+        for a, b in self._segments(first, last):
+            times.extend(times_view[a:b].tolist())
+            for field, view in zip(self.fields, column_views):
+                columns[field].extend(view[a:b].tolist())
+        return times, columns
+
+
+# 集計値の列
+ROLLUP_FIELDS = ('min', 'max', 'avg', 'last')
+
+# 解像度（秒）と保持点数: 1秒×10分、10秒×24時間、5分×30日
+ROLLUP_TIERS = [
+    (1, 600),
+    (10, 8640),
+    (300, 8640),
+]
+
+
+class RollupSeries:
+    """1メトリクス分の多段解像度の時系列
+
+    各段で集計中のバケット（min/max/合計/件数/最終値）を持ち、サンプルごとに O(段数) で更新する。
+    バケットの区間を過ぎた時点で確定値をその段のリングバッファに書き出す。
+    """
+
+    def __init__(self, tiers=ROLLUP_TIERS):
+        self.tiers = [(width, RingBuffer(capacity, ROLLUP_FIELDS)) for width, capacity in tiers]
+        # 段ごとの集計中バケット [開始時刻, min, max, 合計, 件数, 最終値]
+        self._open = [None] * len(self.tiers)
+        self.first_sample = None
+        self.last_update = None
+
+    def add(self, timestamp, value):
+        if self.first_sample is None:
+            self.first_sample = timestamp
+        self.last_update = timestamp
+        for i, (width, buffer) in enumerate(self.tiers):
+            bucket_start = timestamp - timestamp % width
+            bucket = self._open[i]
+            if bucket is not None and bucket[0] != bucket_start:
+                buffer.append(bucket[0], bucket[1], bucket[2], bucket[3] / bucket[4], bucket[5])
+                bucket = None
+            if bucket is None:
+                self._open[i] = [bucket_start, value, value, value, 1, value]
+            else:
+                if value < bucket[1]:
+                    bucket[1] = value
+                if value > bucket[2]:
+                    bucket[2] = value
+                bucket[3] += value
+                bucket[4] += 1
+                bucket[5] = value
+
+    def choose_tier(self, since, until, points):
+        """範囲と点数の上限から使う段を選ぶ
+
+        since までさかのぼれる段のうち、点数が上限に収まる最も細かい段を選ぶ。
+        どの段も収まらなければ最も粗い段を使う。
+        """
+        span = until - since
+        for i, (width, buffer) in enumerate(self.tiers):
+            oldest = buffer.oldest()
+            covers = buffer.capacity * width >= until - since and (oldest is None or oldest <= since or len(buffer) < buffer.capacity)
+            if covers and (points is None or span / width <= points):
+                return i
+        return len(self.tiers) - 1
+
+    def query(self, tier, since=None, until=None, limit=None):
+        width, buffer = self.tiers[tier]
+        times, columns = buffer.query(since, until, limit)
+        # 集計中のバケットも最新の点として含める
+        bucket = self._open[tier]
+        if bucket is not None and (since is None or bucket[0] > since) and (until is None or bucket[0] <= until):
+            times.append(bucket[0])
+            columns['min'].append(bucket[1])
+            columns['max'].append(bucket[2])
+            columns['avg'].append(bucket[3] / bucket[4])
+            columns['last'].append(bucket[5])
+            if limit is not None and len(times) > limit:
+                times = times[-limit:]
+                columns = {field: values[-limit:] for field, values in columns.items()}
+        return width, times, columns
+
+
+def downsample(width, times, columns, points):
+    """集計済みの点を points 個に収まるよう width の整数倍の区間にまとめ直す
+
+    区間の min/max/last はそのまま求め、平均は各点の平均の平均とする。(解像度, 時刻リスト, {列名: 値リスト}) を返す。
+    """
+    if points is None or len(times) <= points:
+        return width, times, columns
+    span = times[-1] - times[0] + width
+    width *= max(2, int(-(-span // (width * points))))
+    merged_times = []
+    merged = {field: [] for field in ROLLUP_FIELDS}
+    count = 0
+    for i, timestamp in enumerate(times):
+        start = timestamp - timestamp % width
+        if merged_times and merged_times[-1] == start:
+            merged['min'][-1] = min(merged['min'][-1], columns['min'][i])
+            merged['max'][-1] = max(merged['max'][-1], columns['max'][i])
+            merged['avg'][-1] += columns['avg'][i]
+            merged['last'][-1] = columns['last'][i]
+            count += 1
+            continue
+        if merged_times:
+            merged['avg'][-1] /= count
+        merged_times.append(start)
+        for field in ROLLUP_FIELDS:
+            merged[field].append(columns[field][i])
+        count = 1
+    if merged_times:
+        merged['avg'][-1] /= count
+    return width, merged_times, merged
+
+
+# 更新の途絶えた系列を探す間隔（秒）
+SWEEP_INTERVAL = 600
+
+
+class MetricStore:
+    """メトリクス名ごとの多段解像度時系列を束ねたサーバー側の時系列ストア
+
+    最も長い段の保持期間を過ぎても更新のない系列（消えたNICやマウントなど）は捨てる。
+    """
+
+    def __init__(self, tiers=ROLLUP_TIERS):
+        self.tiers = tiers
+        self.retention = max(width * capacity for width, capacity in tiers)
+        self._series = {}
+        self._last_sweep = None
+        self._lock = threading.Lock()
+
+    def record(self, timestamp, values):
+        """{メトリクス名: 値} をまとめて追加する"""
+        with self._lock:
+            for name, value in values.items():
+                series = self._series.get(name)
+                if series is None:
+                    series = self._series[name] = RollupSeries(self.tiers)
+                series.add(timestamp, value)
+            if self._last_sweep is None or timestamp - self._last_sweep >= SWEEP_INTERVAL:
+                self._last_sweep = timestamp
+                self._sweep(timestamp)
+
+    def _sweep(self, now):
+        # ロックを持った状態で呼ぶ
+        for name in [name for name, series in self._series.items()
+                     if now - series.last_update > self.retention]:
+            del self._series[name]
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._series)
+
+    def oldest(self, name):
+        """メモリ上に残っている最も古いサンプルの時刻
+
+        バケットの開始時刻は最初のサンプルより前になりうるので、記録を始めてからのサンプルが残っている間は
+        最初のサンプルの時刻を返す。最も粗い段も一周して古い点を上書きしたら、残っている最も古いバケットの開始時刻を返す。
+        """
+        with self._lock:
+            series = self._series.get(name)
+            if series is None or series.first_sample is None:
+                return None
+            _, coarsest = series.tiers[-1]
+            if len(coarsest) < coarsest.capacity:
+                return series.first_sample
+            return max(series.first_sample, coarsest.oldest())
+
+    def resolution(self, since, until, points):
+        """since〜until を points 点以内で返せる最も細かい段の解像度（どの段も収まらなければ最も粗い段）
+
+        ディスクのログをメモリ上の段と同じ区切りで集計するときに使う。
+        """
+        span = until - since
+        for width, capacity in self.tiers:
+            if capacity * width >= span and (points is None or span / width <= points):
+                return width
+        return self.tiers[-1][0]
+
+    def query(self, name, since=None, until=None, points=None, limit=None, width=None):
+        """メトリクスの時系列を (解像度, 時刻リスト, {列名: 値リスト}) で返す。存在しなければ None
+
+        解像度は since〜until の範囲と points（点数の上限）から自動で選ぶ。width を指定するとその解像度の段を使う。
+        """
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                return None
+            if width is not None:
+                tier = [tier_width for tier_width, _ in series.tiers].index(width)
+            elif since is None:
+                tier = 0
+            else:
+                tier = series.choose_tier(since, until if until is not None else time.time(), points)
+            return series.query(tier, since, until, limit)
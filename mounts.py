@@ -0,0 +1,154 @@
+import os
+import select
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+import psutil
+
+# 容量を見ても意味のない疑似ファイルシステム
+PSEUDO_FSTYPES = {
+    'autofs', 'binfmt_misc', 'bpf', 'cgroup', 'cgroup2', 'configfs', 'debugfs',
+    'devpts', 'devtmpfs', 'efivarfs', 'fusectl', 'hugetlbfs', 'mqueue', 'nsfs',
+    'overlay', 'proc', 'pstore', 'ramfs', 'rpc_pipefs', 'securityfs', 'squashfs',
+    'sysfs', 'tmpfs', 'tracefs',
+}
+
+MOUNTINFO = '/proc/self/mountinfo'
+
+
+class MountTable:
+    """マウント一覧のキャッシュ
+
+    /proc/self/mountinfo はマウントの追加・削除時に POLLPRI で通知されるので、
+    通知があったときだけ disk_partitions() を呼び直す。poll が使えない環境では ttl 秒ごとに取り直す。
+    """
+
+    def __init__(self, mountinfo=MOUNTINFO, ttl=30.0):
+        self.mountinfo = mountinfo
+        self.ttl = ttl
+        self._partitions = None
+        self._loaded_at = 0.0
+        self._poller = None
+        self._fd = None
+        self._lock = threading.Lock()
+        try:
+            self._fd = os.open(mountinfo, os.O_RDONLY)
+            self._poller = select.poll()
+            self._poller.register(self._fd, select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            self._poller = None
+
+    def _changed(self):
+        if self._poller is None:
+            return time.monotonic() - self._loaded_at >= self.ttl
+        changed = bool(self._poller.poll(0))
+        if changed:
+            # 通知を解除するには先頭から読み直す必要がある
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            while os.read(self._fd, 65536):
+                pass
+        return changed
+
+    def partitions(self):
+        """疑似ファイルシステムを除いたマウント一覧を返す"""
+        with self._lock:
+            if self._partitions is None or self._changed():
+                self._partitions = [p for p in psutil.disk_partitions()
+                                    if p.fstype not in PSEUDO_FSTYPES]
+                self._loaded_at = time.monotonic()
+            return self._partitions
+
+
+class UsageProber:
+    """statvfs をタイムアウト付きでワーカースレッドで実行する
+
+    NFSなどの応答しないマウントで statvfs が固まっても呼び出し側は待たされない。
+    固まったマウントには前回の処理が終わるまで新しい statvfs を投げない。
+    応答しているマウントは少数のスレッドを使い回すプールで調べる。期限に間に合わなかったマウントは、
+    期限内に応答するようになるまでマウントごとのスレッドで調べ、プールのスレッドが固まっていればプールを作り直すので、
+    固まったマウントがいくつあっても他のマウントの statvfs は待たされない。
+    """
+
+    def __init__(self, timeout=2.0, workers=4):
+        self.timeout = timeout
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='statvfs')
+        self._pending = {}     # マウントポイント -> (実行中の Future, プールで実行したか)
+        self._slow = set()     # 期限に間に合わなかったマウントポイント
+        self._last_usage = {}  # マウントポイント -> 前回成功した結果
+        self._lock = threading.Lock()
+
+    def _submit(self, mountpoint):
+        with self._lock:
+            pending = self._pending.get(mountpoint)
+            if pending is None:
+                if mountpoint in self._slow:
+                    future = Future()
+                    threading.Thread(target=self._probe, args=(mountpoint, future),
+                                     name=f"statvfs {mountpoint}", daemon=True).start()
+                else:
+                    future = self._executor.submit(psutil.disk_usage, mountpoint)
+                pending = self._pending[mountpoint] = (future, mountpoint not in self._slow)
+            return pending[0]
+
+    @staticmethod
+    def _probe(mountpoint, future):
+        try:
+            future.set_result(psutil.disk_usage(mountpoint))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _finish(self, mountpoint, future, usage=None):
+        with self._lock:
+            pending = self._pending.get(mountpoint)
+            if pending is not None and pending[0] is future:
+                del self._pending[mountpoint]
+            self._slow.discard(mountpoint)
+            if usage is not None:
+                self._last_usage[mountpoint] = usage
+
+    def _missed(self, mountpoint, future):
+        with self._lock:
+            pending = self._pending.get(mountpoint)
+            if mountpoint in self._slow or pending is None or pending[0] is not future:
+                return
+            self._slow.add(mountpoint)
+            if pending[1]:
+                # 固まったスレッドは古いプールに残して終わるのを待たず、新しいプールに切り替える
+                self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='statvfs')
+
+    def usages(self, mountpoints):
+        """各マウントポイントの (使用量, 古い値かどうか, 例外) を返す
+
+        全マウントの statvfs を同時に投げ、まとめて timeout 秒だけ待つ。
+        期限までに終わらなければ前回成功した値を古い値として返す（無ければ None）。
+        マウント表から消えたマウントポイントの前回値は捨てる。
+        """
+        futures = [(mountpoint, self._submit(mountpoint)) for mountpoint in mountpoints]
+        deadline = time.monotonic() + self.timeout
+        results = {}
+        for mountpoint, future in futures:
+            try:
+                usage = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                self._missed(mountpoint, future)
+                results[mountpoint] = (self._last_usage.get(mountpoint), True, None)
+                continue
+            except Exception as e:
+                self._finish(mountpoint, future)
+                results[mountpoint] = (None, False, e)
+                continue
+            self._finish(mountpoint, future, usage)
+            results[mountpoint] = (usage, False, None)
+        with self._lock:
+            for mountpoint in [mountpoint for mountpoint in self._last_usage if mountpoint not in results]:
+                del self._last_usage[mountpoint]
+            self._slow.intersection_update(results)
+        return results
+
+    def hung(self):
+        """statvfs が終わっていないマウントポイントの一覧"""
+        with self._lock:
+            return sorted(mountpoint for mountpoint, (future, _) in self._pending.items() if not future.done())
@@ -0,0 +1,313 @@
+import asyncio
+import errno
+import ipaddress
+import itertools
+import os
+import socket
+import struct
+
+import psutil
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# ICMPが使えない場合に接続を試すポート（Linuxサーバーを想定してSSHを先頭に）
+TCP_PROBE_PORTS = (22, 80, 443)
+
+# TCPで同時に確認するホスト数の上限（1ホストにつき TCP_PROBE_PORTS の数だけソケットを開く）
+TCP_CONCURRENCY = 512
+
+# TCPの確認に使ってよいファイルディスクリプタの割合（残りはアプリ本体の接続やファイル用）
+TCP_FD_SHARE = 0.5
+
+# 1秒あたりに送るプローブ数の上限（/16 でも約30秒で一巡する）
+DEFAULT_RATE = 2000
+
+# 最後のプローブを送ってから応答を待つ時間（秒）。LAN内の往復は数ミリ秒なので短くてよい
+DEFAULT_TIMEOUT = 0.4
+
+# 送信は 1/BATCHES_PER_SECOND 秒ごとにまとめて行う
+BATCHES_PER_SECOND = 100
+
+# インターフェースのサブネットがこれより広い場合は、自分のアドレスを含む /16 だけを対象にする
+MIN_LOCAL_PREFIXLEN = 16
+
+
+def local_networks(min_prefixlen=MIN_LOCAL_PREFIXLEN):
+    """ループバック以外の全インターフェースのIPv4サブネット"""
+    networks = []
+    for addrs in psutil.net_if_addrs().values():
+        for addr in addrs:
+            if addr.family != socket.AF_INET or not addr.netmask:
+                continue
+            try:
+                interface = ipaddress.ip_interface(f"{addr.address}/{addr.netmask}")
+            except ValueError:
+                continue
+            if interface.ip.is_loopback or interface.ip.is_link_local:
+                continue
+            network = interface.network
+            if network.prefixlen < min_prefixlen:
+                network = ipaddress.ip_interface(f"{addr.address}/{min_prefixlen}").network
+            networks.append(network)
+    return networks
+
+
+def local_addresses():
+    """このホストに割り当てられているIPv4アドレスの集合"""
+    return {addr.address for addrs in psutil.net_if_addrs().values()
+            for addr in addrs if addr.family == socket.AF_INET}
+
+
+def parse_networks(cidrs):
+    """CIDR文字列のリストを ip_network にする。不正なものは (有効なリスト, 不正なリスト) の後者に入る"""
+    networks, invalid = [], []
+    for cidr in cidrs:
+        try:
+            networks.append(ipaddress.ip_network(cidr, strict=False))
+        except ValueError:
+            invalid.append(cidr)
+    return networks, invalid
+
+
+def iter_targets(networks, exclude=()):
+    """ネットワーク群のホストアドレスを1つずつ返す
+
+    重なるネットワークはまとめてから回すので同じアドレスを二度返さない。
+    アドレスはその都度生成するため、/16 でも全アドレスのリストは作らない。
+    """
+    ipv4 = [network for network in networks if network.version == 4]
+    for network in ipaddress.collapse_addresses(ipv4):
+        for ip in network.hosts():
+            ip = str(ip)
+            if ip not in exclude:
+                yield ip
+
+
+def count_targets(networks):
+    ipv4 = [network for network in networks if network.version == 4]
+    total = 0
+    for network in ipaddress.collapse_addresses(ipv4):
+        total += network.num_addresses - 2 if network.prefixlen < 31 else network.num_addresses
+    return total
+
+
+class RateLimiter:
+    """送信を rate 件/秒 に抑える。1/BATCHES_PER_SECOND 秒分ずつまとめて送ってから待つ"""
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self.batch = max(1, int(rate / BATCHES_PER_SECOND)) if rate else None
+        self.rate = rate
+        self._started = None
+        self._sent = 0
+
+    async def wait(self):
+        if not self.rate:
+            return
+        loop = asyncio.get_event_loop()
+        if self._started is None:
+            self._started = loop.time()
+        self._sent += 1
+        if self._sent % self.batch == 0:
+            delay = self._started + self._sent / self.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def build_echo_request(ident, seq, payload=b'servermonitor'):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def open_icmp_socket():
+    """ICMPソケットを開く。(ソケット, rawかどうか) を返し、開けなければ None
+
+    まず一般ユーザーでも使える ping ソケット（net.ipv4.ping_group_range で許可されている場合）、
+    次に raw ソケット（root または CAP_NET_RAW が必要）を試す。
+    """
+    for sock_type, raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+        try:
+            sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except (PermissionError, OSError):
+            continue
+        sock.setblocking(False)
+        return sock, raw
+    return None
+
+
+async def icmp_scan(sock, raw, addresses, timeout=DEFAULT_TIMEOUT, on_alive=None, rate=DEFAULT_RATE):
+    """1つのソケットから各アドレスにエコー要求を送り、応答をシーケンス番号で突き合わせる
+
+    addresses はイテレータでよい。応答待ちの表には送ってから timeout 秒以内のものだけを残すので、
+    表の大きさは rate × timeout 程度に収まる。
+    """
+    loop = asyncio.get_event_loop()
+    # ping ソケットでは識別子はカーネルが書き換えるので、raw ソケットの場合だけ照合に使う
+    ident = os.getpid() & 0xffff
+    pending = {}  # シーケンス番号 -> (アドレス, 送信時刻)。送信順に並ぶ
+    alive = set()
+    drained = asyncio.Event()
+    limiter = RateLimiter(rate)
+    last_sent = None
+
+    def on_readable():
+        while True:
+            try:
+                data, (addr, _) = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if raw:
+                # raw ソケットではIPヘッダーが付いてくる
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, reply_ident, seq = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (raw and reply_ident != ident):
+                continue
+            target = pending.get(seq)
+            if target is not None and target[0] == addr:
+                del pending[seq]
+                alive.add(addr)
+                if on_alive is not None:
+                    on_alive(addr)
+                if not pending:
+                    drained.set()
+
+    def expire(now):
+        # 期限切れの要求は先頭に集まっている
+        while pending:
+            seq, (_, sent) = next(iter(pending.items()))
+            if now - sent < timeout:
+                break
+            del pending[seq]
+
+    loop.add_reader(sock.fileno(), on_readable)
+    try:
+        for seq, ip in zip(itertools.cycle(range(1, 0x10000)), addresses):
+            now = loop.time()
+            expire(now)
+            pending.pop(seq, None)
+            pending[seq] = (ip, now)
+            last_sent = now
+            packet = build_echo_request(ident, seq)
+            for _ in range(3):
+                try:
+                    sock.sendto(packet, (ip, 0))
+                    break
+                except (BlockingIOError, InterruptedError):
+                    # 送信バッファが一杯なら少し待って再送
+                    await asyncio.sleep(0.001)
+                except OSError:
+                    # 経路がないなどの送信エラーは応答なしとして扱う
+                    pending.pop(seq, None)
+                    break
+            await limiter.wait()
+        if pending:
+            drained.clear()
+            try:
+                await asyncio.wait_for(drained.wait(), max(0.0, last_sent + timeout - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        loop.remove_reader(sock.fileno())
+    return alive
+
+
+def tcp_concurrency(ports=TCP_PROBE_PORTS, limit=TCP_CONCURRENCY):
+    """開くソケットの合計がファイルディスクリプタの上限の TCP_FD_SHARE に収まる同時ホスト数"""
+    if resource is None:
+        return limit
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return limit
+    return max(1, min(limit, int(soft * TCP_FD_SHARE) // len(ports)))
+
+
+async def tcp_probe(ip, ports=TCP_PROBE_PORTS, timeout=DEFAULT_TIMEOUT):
+    """いずれかのポートで接続できるか、接続拒否（RST）が返れば生きているとみなす"""
+    async def attempt(port):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port),
+                                                   max(0.0, deadline - loop.time()))
+            except ConnectionRefusedError:
+                return True
+            except OSError as e:
+                # ディスクリプタが足りないのはホストの応答とは関係ないので、空くのを待ってやり直す
+                if e.errno in (errno.EMFILE, errno.ENFILE) and loop.time() < deadline:
+                    await asyncio.sleep(0.01)
+                    continue
+                return False
+            except asyncio.TimeoutError:
+                return False
+            writer.close()
+            return True
+
+    results = await asyncio.gather(*(attempt(port) for port in ports))
+    return any(results)
+
+
+async def tcp_scan(addresses, timeout=DEFAULT_TIMEOUT, on_alive=None, rate=DEFAULT_RATE, concurrency=None):
+    """concurrency 個のワーカーで addresses（イテレータ）を順に取り出して確認する
+
+    concurrency を省略すると、ファイルディスクリプタの上限に収まる数（最大 TCP_CONCURRENCY）にする。
+    """
+    if concurrency is None:
+        concurrency = tcp_concurrency()
+    addresses = iter(addresses)
+    limiter = RateLimiter(rate)
+    alive = set()
+
+    async def worker():
+        for ip in addresses:
+            await limiter.wait()
+            if await tcp_probe(ip, timeout=timeout):
+                alive.add(ip)
+                if on_alive is not None:
+                    on_alive(ip)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return alive
+
+
+async def scan_async(addresses, timeout=DEFAULT_TIMEOUT, on_alive=None, rate=DEFAULT_RATE):
+    """応答のあったアドレスの集合を返す。ICMPソケットが開けなければTCP接続で確認する"""
+    opened = open_icmp_socket()
+    if opened is None:
+        return await tcp_scan(addresses, timeout, on_alive, rate)
+    sock, raw = opened
+    try:
+        return await icmp_scan(sock, raw, addresses, timeout, on_alive, rate)
+    finally:
+        sock.close()
+
+
+def scan_hosts(addresses, timeout=DEFAULT_TIMEOUT, on_alive=None, rate=DEFAULT_RATE):
+    """scan_async を専用のイベントループで実行する（スレッドから呼ぶ用）
+
+    on_alive は応答があった時点でアドレスを引数に呼ばれる。
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(scan_async(iter(addresses), timeout, on_alive, rate))
+    finally:
+        loop.close()
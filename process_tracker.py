@@ -0,0 +1,84 @@
+import heapq
+import threading
+import time
+
+import psutil
+
+
+class ProcessTracker:
+    """プロセス表を保持し、CPU使用率の上位プロセスを差分的に求める
+
+    psutil.Process オブジェクトを (pid, create_time) をキーにサンプル間で保持するので、
+    cpu_percent は前回サンプルからの正しい差分になる。新規プロセスは初回サンプルでは 0.0、
+    消えたPIDはサンプルごとに表から取り除き、PIDが別のプロセスに再利用されていたら（起動時刻が違えば）入れ替える。
+    """
+
+    def __init__(self):
+        self._procs = {}      # pid -> ((pid, create_time), psutil.Process)
+        self._usernames = {}  # (pid, create_time) -> ユーザー名（変わらないので一度だけ取得）
+        self._rows = []
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """全プロセスのCPU・メモリ使用率を更新する"""
+        pids = psutil.pids()
+        alive = set(pids)
+
+        # 消えたPIDを取り除く
+        for pid in [pid for pid in self._procs if pid not in alive]:
+            key, _ = self._procs.pop(pid)
+            self._usernames.pop(key, None)
+
+        rows = []
+        for pid in pids:
+            entry = self._procs.get(pid)
+            try:
+                # is_running() は起動時刻を比べるので、同じPIDの別プロセスなら False になる
+                if entry is not None and not entry[1].is_running():
+                    self._usernames.pop(entry[0], None)
+                    del self._procs[pid]
+                    entry = None
+                if entry is None:
+                    proc = psutil.Process(pid)
+                    key = (pid, proc.create_time())
+                    self._procs[pid] = (key, proc)
+                else:
+                    key, proc = entry
+                with proc.oneshot():
+                    cpu = proc.cpu_percent(interval=None)
+                    mem = proc.memory_percent()
+                    name = proc.name()
+                    if key not in self._usernames:
+                        try:
+                            self._usernames[key] = proc.username()
+                        except (psutil.AccessDenied, KeyError):
+                            self._usernames[key] = None
+            except psutil.ZombieProcess:
+                continue
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                # 終了したかアクセスできないプロセスは次回から対象外にする
+                self._procs.pop(pid, None)
+                continue
+            rows.append((cpu, mem, pid, name, key))
+
+        self._rows = rows
+        self._sampled_at = time.monotonic()
+        return len(rows)
+
+    def top(self, n=20, max_age=None):
+        """CPU使用率の上位 n プロセスを返す
+
+        max_age を指定すると、前回サンプルがそれより新しい場合は再サンプルしない。
+        """
+        with self._lock:
+            if max_age is None or time.monotonic() - self._sampled_at >= max_age:
+                self.sample()
+            rows = heapq.nlargest(n, self._rows, key=lambda row: row[0])
+            return [{
+                'pid': pid,
+                'name': name,
+                'username': self._usernames.get(key),
+                'memory_percent': round(mem, 2),
+                'cpu_percent': cpu,
+            } for cpu, mem, pid, name, key in rows]
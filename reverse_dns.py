@@ -0,0 +1,64 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReverseResolver:
+    """逆引き（PTR）をワーカースレッドで行い、結果をキャッシュする
+
+    引けた名前は ttl 秒、引けなかったアドレスは negative_ttl 秒のあいだ覚えておき、再問い合わせしない。
+    同じアドレスへの問い合わせが実行中なら新しく投げず、完了時にまとめてコールバックを呼ぶ。
+    呼び出し側は待たされないので、応答しないDNSサーバーがあってもスキャン結果はすぐ返せる。
+    """
+
+    def __init__(self, ttl=3600.0, negative_ttl=300.0, workers=8):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rdns')
+        self._cache = {}    # アドレス -> (ホスト名 または None, 有効期限)
+        self._pending = {}  # アドレス -> 完了時に呼ぶコールバックのリスト
+        self._lock = threading.Lock()
+
+    def cached(self, ip):
+        """キャッシュ済みのホスト名。未解決・期限切れ・引けなかった場合は None"""
+        with self._lock:
+            entry = self._cache.get(ip)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def resolve(self, ip, callback=None):
+        """ip の逆引きを予約する。結果が出たら callback(ip, ホスト名 または None) を呼ぶ
+
+        有効なキャッシュがあればその場で callback を呼ぶ。
+        """
+        with self._lock:
+            entry = self._cache.get(ip)
+            if entry is not None and entry[1] >= time.monotonic():
+                hostname = entry[0]
+            else:
+                callbacks = self._pending.get(ip)
+                if callbacks is None:
+                    callbacks = self._pending[ip] = []
+                    self._executor.submit(self._lookup, ip)
+                if callback is not None:
+                    callbacks.append(callback)
+                return
+        if callback is not None:
+            callback(ip, hostname)
+
+    def _lookup(self, ip):
+        try:
+            hostname = socket.gethostbyaddr(ip)[0]
+        except (OSError, UnicodeError):
+            hostname = None
+        ttl = self.ttl if hostname is not None else self.negative_ttl
+        with self._lock:
+            self._cache[ip] = (hostname, time.monotonic() + ttl)
+            callbacks = self._pending.pop(ip, [])
+        for callback in callbacks:
+            try:
+                callback(ip, hostname)
+            except Exception as e:
+                print(f"逆引き結果の反映中にエラーが発生しました: {e}")
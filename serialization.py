@@ -0,0 +1,55 @@
+import json
+
+# orjson があれば使い、無ければ標準ライブラリでエンコードする
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    """オブジェクトをJSONのバイト列にする"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """JSONのバイト列（memoryview も可）をオブジェクトにする"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+class FragmentCache:
+    """セクションごとのエンコード済みJSON断片を保持する
+
+    セクションの値が前回と同じオブジェクトなら、エンコード済みの断片をそのまま使う。
+    サンプラーは内容が変わらなかったセクションに前回と同じオブジェクトを入れ続けるので、
+    変化していないセクションは再エンコードされない。
+    """
+
+    def __init__(self):
+        self._fragments = {}  # セクション名 -> (値オブジェクト, エンコード済みバイト列)
+
+    def fragment(self, name, value):
+        cached = self._fragments.get(name)
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        encoded = dumps(value)
+        self._fragments[name] = (value, encoded)
+        return encoded
+
+    def encode_object(self, mapping, extra=None):
+        """dict をエンコードする。dict/list の値はキャッシュ済みの断片を継ぎ合わせる"""
+        parts = []
+        for items in (mapping.items(), (extra or {}).items()):
+            for name, value in items:
+                if isinstance(value, (dict, list)):
+                    encoded = self.fragment(name, value)
+                else:
+                    encoded = dumps(value)
+                parts.append(dumps(name) + b':' + encoded)
+        return b'{' + b','.join(parts) + b'}'
@@ -0,0 +1,219 @@
+import argparse
+import importlib
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+from shared_snapshot import SharedSnapshot
+
+# アプリごとの起動方法（shared が True のアプリは収集プロセスを分け、ワーカーを複数起動できる）
+APPS = {
+    'app': {'shared': True},
+    'server_monitor': {'shared': False},
+}
+
+DEFAULT_WORKERS = 2
+DEFAULT_KEEPALIVE = 5.0
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+
+# 子プロセスがすぐに落ち続ける場合の再起動の間隔（秒）
+RESTART_DELAY = 1.0
+
+
+class WorkerServer(ThreadedWSGIServer):
+    """終了時に処理中のリクエストを待つスレッド型のWSGIサーバー"""
+
+    daemon_threads = False
+    block_on_close = True
+
+
+def make_handler(keepalive):
+    # HTTP/1.1 のキープアライブ接続を使い、keepalive 秒アイドルなら切る
+    return type('KeepAliveHandler', (WSGIRequestHandler,), {
+        'protocol_version': 'HTTP/1.1',
+        'timeout': keepalive,
+    })
+
+
+def run_collector(module_name, channel, address):
+    module = importlib.import_module(module_name)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    module.start_collector(channel, address)
+    stop.wait()
+    module.stop_collector()
+
+
+def run_worker(module_name, shared, listener, channel, address, keepalive):
+    module = importlib.import_module(module_name)
+    if shared:
+        module.attach_worker(channel, address)
+    else:
+        module.prepare_dashboard()
+    # 同じ接続を取り合って負けたワーカーが accept で止まらないよう、待ち受けはノンブロッキングにする
+    listener.setblocking(False)
+    host, port = listener.getsockname()[:2]
+    server = WorkerServer(host, port, module.app, make_handler(keepalive), fd=listener.fileno())
+    listener.close()
+
+    def shutdown(signum, frame):
+        # 新しい接続の受け付けをやめ、ストリーム配信を終わらせる（serve_forever の外から止める）
+        threading.Thread(target=server.shutdown, daemon=True).start()
+        stop_worker = getattr(module, 'stop_worker', None)
+        if stop_worker is not None:
+            stop_worker()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    server.serve_forever()
+    # 処理中のリクエストが終わるまで待つ（待ちきれなければ親が強制終了する）
+    server.server_close()
+    # 子プロセスは atexit を通らずに終わるので、書き出しなどの後始末はここで行う
+    close_worker = getattr(module, 'close_worker', None)
+    if close_worker is not None:
+        close_worker()
+
+
+def spawn(target, *args):
+    pid = os.fork()
+    if pid:
+        return pid
+    # Ctrl-C は親だけが受けて、子には SIGTERM で順に止めさせる
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 0
+    try:
+        target(*args)
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def open_listener(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.create_server((host, port), family=family, backlog=backlog)
+    listener.set_inheritable(True)
+    return listener
+
+
+def stop_processes(pids, timeout):
+    """SIGTERM を送って timeout 秒まで終了を待ち、残ったものは SIGKILL する"""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    remaining = set(pids)
+    deadline = time.monotonic() + timeout
+    while remaining and time.monotonic() < deadline:
+        for pid in list(remaining):
+            try:
+                done = os.waitpid(pid, os.WNOHANG)[0]
+            except ChildProcessError:
+                done = True
+            if done:
+                remaining.discard(pid)
+        time.sleep(0.05)
+    for pid in remaining:
+        print(f"プロセス {pid} が {timeout:g} 秒以内に終了しないため強制終了します")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='サーバー監視ダッシュボードを本番用の設定で起動する')
+    parser.add_argument('--app', choices=sorted(APPS), default='app', help='起動するアプリ')
+    parser.add_argument('--host', default='0.0.0.0', help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=5000, help='待ち受けるポート')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'ワーカープロセス数（既定: {DEFAULT_WORKERS}）')
+    parser.add_argument('--keepalive', type=float, default=DEFAULT_KEEPALIVE,
+                        help=f'キープアライブ接続を切るまでのアイドル秒数（既定: {DEFAULT_KEEPALIVE:g}）')
+    parser.add_argument('--graceful-timeout', type=float, default=DEFAULT_GRACEFUL_TIMEOUT,
+                        help=f'終了時に処理中のリクエストを待つ秒数（既定: {DEFAULT_GRACEFUL_TIMEOUT:g}）')
+    parser.add_argument('--backlog', type=int, default=1024, help='接続待ちキューの長さ')
+    args = parser.parse_args(argv)
+    # ログをファイルに流しても各プロセスの出力が行単位で混ざるようにする
+    sys.stdout.reconfigure(line_buffering=True)
+
+    shared = APPS[args.app]['shared']
+    workers = args.workers
+    if workers < 1:
+        parser.error('--workers は1以上を指定してください')
+    if not shared and workers > 1:
+        # 選択中のサーバーやスキャンの状態をプロセス内に持つため、複数のワーカーには分けられない
+        print(f"{args.app} は1ワーカーで起動します")
+        workers = 1
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    listener = open_listener(args.host, args.port, args.backlog)
+    # 子プロセスを fork する前に共有メモリを作り、全プロセスで同じマッピングを使う
+    channel = SharedSnapshot() if shared else None
+    # 収集プロセスがワーカーからの問い合わせ（履歴など）を受けるUnixソケット
+    control_dir = tempfile.mkdtemp(prefix='server-monitor-') if shared else None
+    address = os.path.join(control_dir, 'collector.sock') if shared else None
+
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    def start_collector():
+        return spawn(run_collector, args.app, channel, address)
+
+    def start_worker():
+        return spawn(run_worker, args.app, shared, listener, channel, address, args.keepalive)
+
+    # メトリクスの収集はホストごとに1プロセスだけで行い、ワーカーはその結果を読む
+    collector = start_collector() if shared else None
+    worker_pids = {start_worker() for _ in range(workers)}
+    print(f"http://{args.host}:{args.port} で待ち受けます（{args.app}, ワーカー {workers}）")
+
+    try:
+        while not stopping.is_set():
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid == 0:
+                stopping.wait(0.5)
+                continue
+            if stopping.is_set():
+                break
+            # 落ちた子プロセスは起動し直す
+            print(f"プロセス {pid} が終了しました（状態 {status}）。起動し直します")
+            time.sleep(RESTART_DELAY)
+            if pid == collector:
+                collector = start_collector()
+            elif pid in worker_pids:
+                worker_pids.discard(pid)
+                worker_pids.add(start_worker())
+    finally:
+        print('終了しています...')
+        stop_processes(worker_pids, args.graceful_timeout)
+        listener.close()
+        if collector is not None:
+            stop_processes([collector], args.graceful_timeout)
+        if channel is not None:
+            channel.close()
+            channel.unlink()
+        if control_dir is not None:
+            shutil.rmtree(control_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
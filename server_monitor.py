@@ -1,120 +1,109 @@
 from flask import Flask, render_template, jsonify, request
-import psutil
-import platform
-import datetime
-import socket
 import os
 import time
-import subprocess
 import json
+import atexit
 import threading
-from concurrent.futures import ThreadPoolExecutor
+
+from agent import AGENT_PORT
+from agent_client import AgentError, AgentPool
+from alerts import FLEET_RULES, load_alerting
+from config_store import ConfigWriter, HostJournal
+from discovery import HostTable, ScanManager
+from fleet import FleetPoller
+from host_metrics import collect_resources, collect_snapshot, collect_system_info, process_tracker
+from netscan import DEFAULT_RATE, DEFAULT_TIMEOUT
+from reverse_dns import ReverseResolver
+from streaming import SnapshotBroadcaster, event_stream_response
 
 app = Flask(__name__)
 
 # 設定
 CONFIG_FILE = 'monitor_config.json'
+# 見つかったサーバーの一覧（変更分だけを追記する）
+HOSTS_FILE = 'monitor_hosts.jsonl'
 DEFAULT_CONFIG = {
     'theme': 'light',
     'refresh_interval': 5,
     'last_server': '',
-    'found_servers': []
+    # ローカルのサブネットに加えてスキャンするCIDR（例: "10.0.0.0/22"）
+    'scan_networks': [],
+    # 1秒あたりのプローブ数の上限
+    'scan_rate': DEFAULT_RATE,
+    # 最後のプローブを送ってから応答を待つ秒数（応答の遅いWAN越しの範囲では長くする）
+    'scan_timeout': DEFAULT_TIMEOUT,
+    # 監視対象ホストで動かすエージェント（agent.py）のポートと共有トークン
+    'agent_port': AGENT_PORT,
+    'agent_token': ''
 }
 
 # グローバル変数
 config = DEFAULT_CONFIG.copy()
 current_server = None
 servers_lock = threading.Lock()
-found_servers = []
+resolver = ReverseResolver(ttl=3600, negative_ttl=300)
+agent_pool = AgentPool(config)
+broadcaster = SnapshotBroadcaster()
+stream_lock = threading.Lock()
+stream_thread = None
+stream_clients = 0  # /api/stream の接続数（stream_lock で保護）
 
 def load_config():
-    global config
+    # スキャンマネージャーが同じ dict を参照しているので、差し替えずに中身を入れ替える
     try:
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as f:
-                config = json.load(f)
+                loaded = json.load(f)
+            config.clear()
+            config.update(DEFAULT_CONFIG, **loaded)
     except Exception as e:
         print(f"設定ファイル読み込み中にエラーが発生しました: {e}")
-        config = DEFAULT_CONFIG.copy()
+        config.clear()
+        config.update(DEFAULT_CONFIG)
+    
+    hosts = host_journal.load()
+    # 以前の形式（設定ファイル内の found_servers）から移行する
+    legacy = config.pop('found_servers', None)
+    if not hosts and legacy:
+        hosts = legacy
+        for host in legacy:
+            if 'ip' in host:
+                host_journal.record(host['ip'], host)
+        save_config()
+    host_table.load(hosts)
 
 def save_config():
-    try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
-    except Exception as e:
-        print(f"設定ファイル保存中にエラーが発生しました: {e}")
+    """設定の書き出しを予約する（書き込みはバックグラウンドでまとめて行う）"""
+    config_writer.schedule()
 
-def ping_host(ip):
-    """指定されたIPアドレスにpingを実行し、応答があるか確認"""
-    try:
-        # Linuxコマンドでping
-        output = subprocess.run(['ping', '-c', '1', '-W', '1', ip], 
-                               stdout=subprocess.DEVNULL, 
-                               stderr=subprocess.DEVNULL, 
-                               timeout=1.5)
-        return output.returncode == 0
-    except:
-        return False
-
-def get_hostname(ip):
-    """IPアドレスからホスト名を取得試行"""
-    try:
-        return socket.gethostbyaddr(ip)[0]
-    except:
-        return ip
+def servers_updated():
+    """スキャンが終わったら、応答のあるホストのエージェントに接続しておく"""
+    agent_pool.warm([server['ip'] for server in host_table.servers()
+                     if server['online'] and not server['is_local']])
 
-def scan_network():
-    """ネットワークをスキャンして利用可能なLinuxサーバーを見つける"""
-    global found_servers
-    
-    # 自分自身のIPアドレスを取得してネットワークプレフィックスを特定
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        # この接続は実際には確立されない
-        s.connect(('10.255.255.255', 1))
-        local_ip = s.getsockname()[0]
-    except Exception:
-        local_ip = '127.0.0.1'
-    finally:
-        s.close()
-    
-    # ネットワークプレフィックスを取得（例: 192.168.1）
-    prefix = '.'.join(local_ip.split('.')[:3])
-    
-    # スキャン結果を一時的に保存
-    temp_servers = []
-    
-    # 自分自身を追加
-    temp_servers.append({
-        'ip': local_ip,
-        'hostname': socket.gethostname(),
-        'is_local': True
-    })
-    
-    # マルチスレッドでIPアドレスをスキャン
-    def check_ip(i):
-        ip = f"{prefix}.{i}"
-        if ip != local_ip and ping_host(ip):
-            hostname = get_hostname(ip)
-            return {'ip': ip, 'hostname': hostname, 'is_local': False}
-        return None
-    
-    # スレッドプールでIPをスキャン
-    with ThreadPoolExecutor(max_workers=50) as executor:
-        results = executor.map(check_ip, range(1, 255))
-    
-    # 結果をフィルタリング
-    for result in results:
-        if result:
-            temp_servers.append(result)
-    
-    # グローバル変数を更新
-    with servers_lock:
-        found_servers = temp_servers
-        config['found_servers'] = temp_servers
-        save_config()
-    
-    return temp_servers
+config_writer = ConfigWriter(CONFIG_FILE, config)
+host_journal = HostJournal(HOSTS_FILE)
+atexit.register(config_writer.flush)
+atexit.register(host_journal.flush)
+
+host_table = HostTable(listener=host_journal.record)
+scan_manager = ScanManager(host_table, resolver, config, on_change=servers_updated)
+
+# アラートのルール（無ければ既定のルールで alerts.log に出力）
+ALERT_RULES_FILE = 'alert_rules.json'
+ALERT_LOG = 'alerts.log'
+alert_engine, alert_dispatcher = load_alerting(ALERT_RULES_FILE, ALERT_LOG, FLEET_RULES)
+
+def evaluate_alerts(fleet):
+    """全サーバーの取得のたびに host.<IPアドレス>.<項目> のメトリクスとしてアラートを評価する"""
+    values = {}
+    for host in fleet['hosts']:
+        for metric in ('cpu', 'memory', 'disk'):
+            if host[metric] is not None:
+                values[f"host.{host['ip']}.{metric}"] = host[metric]
+    alert_engine.evaluate(fleet['time'], values)
+
+fleet_poller = FleetPoller(host_table, agent_pool, listener=evaluate_alerts)
 
 @app.route('/')
 def index():
@@ -124,84 +113,133 @@ def index():
     if current_server is None:
         # 最後に使ったサーバーがあればそれを使用
         if config['last_server']:
-            for server in found_servers:
-                if server['ip'] == config['last_server']:
-                    current_server = server
-                    break
+            current_server = host_table.get(config['last_server'])
         
         # それでも見つからなければ自分自身を使用
-        if current_server is None and found_servers:
-            for server in found_servers:
+        if current_server is None:
+            for server in host_table.servers():
                 if server.get('is_local', False):
                     current_server = server
                     break
     
-    # まだサーバーが見つからなければスキャンを開始
+    # まだサーバーが見つからなければスキャンを要求（実行中のスキャンがあればそれにまとめる）
     if current_server is None:
-        threading.Thread(target=scan_network).start()
+        scan_manager.request(full=False)
     
     return render_template('index.html', config=config)
 
+def is_remote(server):
+    return server is not None and not server.get('is_local', False)
+
+def collect_current(cpu_interval=None):
+    """監視対象サーバーのスナップショット（ローカル以外はエージェントから取得）"""
+    server = current_server
+    if is_remote(server):
+        return agent_pool.fetch(server['ip'])
+    return collect_snapshot(cpu_interval=cpu_interval)
+
+def remote_section(name):
+    try:
+        return jsonify(agent_pool.fetch(current_server['ip'])[name])
+    except AgentError as e:
+        return jsonify({'error': str(e)}), 502
+
 @app.route('/api/system_info')
 def get_system_info():
-    # システム情報
-    system_info = {
-        'hostname': socket.gethostname(),
-        'platform': platform.platform(),
-        'system': platform.system(),
-        'release': platform.release(),
-        'version': platform.version(),
-        'processor': platform.processor(),
-        'uptime': get_uptime(),
-    }
-    return jsonify(system_info)
+    if is_remote(current_server):
+        return remote_section('system_info')
+    return jsonify(collect_system_info())
 
 @app.route('/api/resources')
 def get_resources():
-    # リソース情報（CPU、メモリ、ディスク）
-    resources = {
-        'cpu': {
-            'percent': psutil.cpu_percent(interval=1),
-            'count': psutil.cpu_count(),
-            'freq': psutil.cpu_freq().current if psutil.cpu_freq() else 'N/A',
-        },
-        'memory': {
-            'total': format_bytes(psutil.virtual_memory().total),
-            'available': format_bytes(psutil.virtual_memory().available),
-            'used': format_bytes(psutil.virtual_memory().used),
-            'percent': psutil.virtual_memory().percent,
-        },
-        'disk': get_disk_info(),
-        'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    }
-    return jsonify(resources)
+    if is_remote(current_server):
+        return remote_section('resources')
+    return jsonify(collect_resources())
 
 @app.route('/api/processes')
 def get_processes():
-    # プロセス情報
-    processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'username', 'memory_percent', 'cpu_percent']):
-        try:
-            pinfo = proc.info
-            pinfo['memory_percent'] = round(pinfo['memory_percent'], 2)
-            processes.append(pinfo)
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-    
-    # CPU使用率でソート
-    processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-    return jsonify(processes[:20])  # 上位20プロセスだけ返す
+    if is_remote(current_server):
+        return remote_section('processes')
+    # プロセス情報（同時リクエストが来ても1秒以内ならサンプルを使い回す）
+    return jsonify(process_tracker.top(20, max_age=1.0))  # 上位20プロセスだけ返す
+
+def stream_loop():
+    """購読者がいる間だけ、更新間隔ごとに1回収集して全購読者に配信する"""
+    global stream_thread
+    try:
+        while True:
+            publish_current()
+            time.sleep(config.get('refresh_interval', 5))
+            # 接続数は /api/stream の中で同じロックの下で数えるので、ここで抜けた直後に来た接続は新しいスレッドを起こす
+            with stream_lock:
+                if stream_clients == 0:
+                    stream_thread = None
+                    return
+    finally:
+        # 想定外の例外で抜けても、次の接続で配信を再開できるようにする
+        with stream_lock:
+            if stream_thread is threading.current_thread():
+                stream_thread = None
+
+def publish_current():
+    try:
+        broadcaster.publish(collect_current(cpu_interval=None))
+    except AgentError as e:
+        broadcaster.publish({'error': str(e)})
+    except Exception as e:
+        print(f"配信する情報の収集中にエラーが発生しました: {e}")
+        broadcaster.publish({'error': str(e)})
+
+@app.route('/api/stream')
+def stream():
+    """リソース情報をServer-Sent Eventsで配信"""
+    global stream_thread, stream_clients
+    response = event_stream_response(broadcaster)
+    with stream_lock:
+        stream_clients += 1
+        if stream_thread is None:
+            stream_thread = threading.Thread(target=stream_loop, daemon=True)
+            stream_thread.start()
+
+    def release():
+        global stream_clients
+        with stream_lock:
+            stream_clients -= 1
+
+    # 応答の送信が終わったとき（途中で切断された場合も含む）に数を戻す
+    response.call_on_close(release)
+    return response
+
+@app.route('/api/fleet')
+def get_fleet():
+    """既知の全ホストの要約とパーセンタイル・ワースト一覧（バックグラウンドで集計済みのものを返す）"""
+    fleet_poller.start()
+    return app.response_class(fleet_poller.body, mimetype='application/json')
+
+@app.route('/api/alerts')
+def get_alerts():
+    """発報中のアラートと直近のイベント"""
+    fleet_poller.start()
+    return jsonify({
+        'active': alert_engine.active(),
+        'recent': list(alert_dispatcher.recent),
+        'suppressed': alert_dispatcher.suppressed
+    })
 
 @app.route('/api/servers')
 def get_servers():
     """見つかったサーバーのリストを返す"""
-    with servers_lock:
-        return jsonify(found_servers)
+    return jsonify(host_table.servers())
+
+@app.route('/api/scan_status')
+def get_scan_status():
+    """スキャンの進捗（対象ネットワーク、対象数、送信済み数、応答数、前回の実行時刻）"""
+    return jsonify(scan_manager.snapshot())
 
 @app.route('/api/scan_servers', methods=['POST'])
 def trigger_scan_servers():
-    """サーバースキャンを開始"""
-    threading.Thread(target=scan_network).start()
+    """サーバースキャンを開始（実行中なら実行中のスキャンにまとめる）"""
+    scan_manager.request(full=True)
     return jsonify({'status': 'scanning'})
 
 @app.route('/api/set_server', methods=['POST'])
@@ -211,13 +249,18 @@ def set_server():
     data = request.json
     ip = data.get('ip')
     
-    with servers_lock:
-        for server in found_servers:
-            if server['ip'] == ip:
-                current_server = server
-                config['last_server'] = ip
-                save_config()
-                return jsonify({'status': 'success'})
+    server = host_table.get(ip)
+    if server is not None:
+        with servers_lock:
+            current_server = server
+            config['last_server'] = ip
+            save_config()
+        if is_remote(server):
+            agent_pool.warm([ip])
+        # 配信中なら切り替え先の情報をすぐに送る
+        if broadcaster.subscribers:
+            threading.Thread(target=publish_current, daemon=True).start()
+        return jsonify({'status': 'success'})
     
     return jsonify({'status': 'error', 'message': '指定されたサーバーが見つかりません'})
 
@@ -234,51 +277,8 @@ def set_theme():
     
     return jsonify({'status': 'error', 'message': '無効なテーマです'})
 
-def get_uptime():
-    # システム起動時間を計算
-    uptime_seconds = int(time.time() - psutil.boot_time())
-    days, remainder = divmod(uptime_seconds, 86400)
-    hours, remainder = divmod(remainder, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    return f"{days}日 {hours}時間 {minutes}分 {seconds}秒"
-
-def format_bytes(bytes):
-    # バイト数を人間が読みやすい形式に変換
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if bytes < 1024.0:
-            return f"{bytes:.2f} {unit}"
-        bytes /= 1024.0
-    return f"{bytes:.2f} PB"
-
-def get_disk_info():
-    # ディスク情報を取得
-    disk_info = []
-    for partition in psutil.disk_partitions():
-        try:
-            usage = psutil.disk_usage(partition.mountpoint)
-            disk_info.append({
-                'device': partition.device,
-                'mountpoint': partition.mountpoint,
-                'fstype': partition.fstype,
-                'total': format_bytes(usage.total),
-                'used': format_bytes(usage.used),
-                'free': format_bytes(usage.free),
-                'percent': usage.percent
-            })
-        except (PermissionError, FileNotFoundError):
-            # 一部のファイルシステムはエラーを起こすことがある
-            pass
-    return disk_info
-
-if __name__ == '__main__':
-    # 設定を読み込む
-    load_config()
-    
-    # テンプレートディレクトリを作成
-    os.makedirs('templates', exist_ok=True)
-    
-    # HTMLテンプレートを作成
-    html_template = '''
+# HTMLテンプレート
+HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html lang="ja">
 <head>
@@ -495,6 +495,30 @@ if __name__ == '__main__':
                 </div>
             </div>
         </div>
+        
+        <!-- フリート概要 -->
+        <div class="card">
+            <div class="card-header">フリート概要 (全サーバー)</div>
+            <div class="card-body">
+                <div class="small mb-2" id="fleet-summary">読込中...</div>
+                <div class="table-responsive">
+                    <table class="table table-sm table-hover">
+                        <thead>
+                            <tr>
+                                <th>サーバー</th>
+                                <th>CPU %</th>
+                                <th>メモリ %</th>
+                                <th>ディスク % (最大)</th>
+                                <th>状態</th>
+                            </tr>
+                        </thead>
+                        <tbody id="fleet-info">
+                            <tr><td colspan="5">読込中...</td></tr>
+                        </tbody>
+                    </table>
+                </div>
+            </div>
+        </div>
     </div>
 
     <!-- スキャン中モーダル -->
@@ -520,6 +544,7 @@ if __name__ == '__main__':
         // グローバル変数
         let refreshInterval = 5000;
         let refreshTimer;
+        let streaming = false;
         let scanningModalInstance = null;
         
         // DOMが読み込まれたら実行
@@ -548,8 +573,9 @@ if __name__ == '__main__':
                 }
             });
             
-            // 初回データ取得
-            fetchAndUpdateData();
+            // データの受信を開始
+            startStream();
+            fetchFleet();
         });
         
         // テーマの初期化
@@ -637,6 +663,8 @@ if __name__ == '__main__':
                 let displayName = `${server.hostname} (${server.ip})`;
                 if (server.is_local) {
                     displayName += ' [ローカル]';
+                } else if (server.online === false) {
+                    displayName += ' [応答なし]';
                 }
                 
                 a.textContent = displayName;
@@ -657,21 +685,22 @@ if __name__ == '__main__':
                 method: 'POST'
             })
             .then(response => response.json())
-            .then(() => {
-                // 3秒後にサーバーリストを取得
-                setTimeout(() => {
-                    fetch('/api/servers')
-                        .then(response => response.json())
-                        .then(data => {
-                            updateServerList(data);
-                            
-                            // モーダルを閉じる
-                            if (scanningModalInstance) {
-                                scanningModalInstance.hide();
-                                scanningModalInstance = null;
-                            }
-                        });
-                }, 3000);
+            .then(() => setTimeout(pollScan, 1000));
+        }
+        
+        // スキャン中は1秒ごとに見つかったサーバーを反映し、終わったらモーダルを閉じる
+        function pollScan() {
+            Promise.all([
+                fetch('/api/servers').then(response => response.json()),
+                fetch('/api/scan_status').then(response => response.json())
+            ]).then(([servers, status]) => {
+                updateServerList(servers);
+                if (status.scanning) {
+                    setTimeout(pollScan, 1000);
+                } else if (scanningModalInstance) {
+                    scanningModalInstance.hide();
+                    scanningModalInstance = null;
+                }
             });
         }
         
@@ -686,14 +715,14 @@ if __name__ == '__main__':
             })
             .then(response => response.json())
             .then(data => {
-                if (data.status === 'success') {
+                if (data.status === 'success' && !streaming) {
                     // データを再取得
                     fetchAndUpdateData();
                 }
             });
         }
         
-        // データ取得と表示を行う関数
+        // データ取得と表示を行う関数（プッシュ配信が使えない場合のポーリング）
         function fetchAndUpdateData() {
             // 既存のタイマーをクリア
             if (refreshTimer) {
@@ -703,121 +732,238 @@ if __name__ == '__main__':
             // システム情報を取得
             fetch('/api/system_info')
                 .then(response => response.json())
-                .then(data => {
-                    let html = '';
-                    for (const [key, value] of Object.entries(data)) {
-                        html += `<tr><td>${key}:</td><td>${value}</td></tr>`;
-                    }
-                    document.getElementById('system-info').innerHTML = html;
-                });
+                .then(updateSystemInfo);
             
             // リソース情報を取得
             fetch('/api/resources')
                 .then(response => response.json())
-                .then(data => {
-                    // 更新時間
-                    document.getElementById('refresh-time').textContent = data.time;
-                    
-                    // CPU情報
-                    const cpuPercent = data.cpu.percent;
-                    document.getElementById('cpu-percent').textContent = `${cpuPercent}%`;
-                    const cpuProgress = document.getElementById('cpu-progress');
-                    cpuProgress.style.width = `${cpuPercent}%`;
-                    
-                    if (cpuPercent > 90) {
-                        cpuProgress.className = 'progress-bar bg-danger';
-                    } else if (cpuPercent > 70) {
-                        cpuProgress.className = 'progress-bar bg-warning';
-                    } else {
-                        cpuProgress.className = 'progress-bar bg-success';
-                    }
-                    
-                    // メモリ情報
-                    const memPercent = data.memory.percent;
-                    document.getElementById('memory-percent').textContent = `${memPercent}%`;
-                    const memProgress = document.getElementById('memory-progress');
-                    memProgress.style.width = `${memPercent}%`;
-                    
-                    if (memPercent > 90) {
-                        memProgress.className = 'progress-bar bg-danger';
-                    } else if (memPercent > 70) {
-                        memProgress.className = 'progress-bar bg-warning';
-                    } else {
-                        memProgress.className = 'progress-bar bg-success';
-                    }
-                    
-                    document.getElementById('memory-details').textContent = 
-                        `合計: ${data.memory.total} | 使用中: ${data.memory.used} | 利用可能: ${data.memory.available}`;
-                    
-                    // ディスク情報
-                    let diskHtml = '';
-                    data.disk.forEach(disk => {
-                        let rowClass = '';
-                        if (disk.percent > 90) {
-                            rowClass = 'table-danger';
-                        } else if (disk.percent > 70) {
-                            rowClass = 'table-warning';
-                        }
-                        
-                        diskHtml += `
-                            <tr class="${rowClass}">
-                                <td>${disk.device}</td>
-                                <td>${disk.mountpoint}</td>
-                                <td>${disk.fstype}</td>
-                                <td>${disk.total}</td>
-                                <td>${disk.used}</td>
-                                <td>${disk.free}</td>
-                                <td>
-                                    <div class="d-flex align-items-center">
-                                        <div class="progress flex-grow-1" style="height: 5px;">
-                                            <div class="progress-bar ${disk.percent > 90 ? 'bg-danger' : disk.percent > 70 ? 'bg-warning' : 'bg-success'}" 
-                                                role="progressbar" style="width: ${disk.percent}%"></div>
-                                        </div>
-                                        <span class="ms-2">${disk.percent}%</span>
-                                    </div>
-                                </td>
-                            </tr>
-                        `;
-                    });
-                    document.getElementById('disk-info').innerHTML = diskHtml;
-                });
+                .then(updateResources);
             
             // プロセス情報を取得
             fetch('/api/processes')
                 .then(response => response.json())
-                .then(data => {
-                    let processHtml = '';
-                    data.forEach(process => {
-                        processHtml += `
-                            <tr>
-                                <td>${process.pid}</td>
-                                <td>${process.name}</td>
-                                <td>${process.username}</td>
-                                <td>${process.cpu_percent.toFixed(1)}%</td>
-                                <td>${process.memory_percent}%</td>
-                            </tr>
-                        `;
-                    });
-                    document.getElementById('process-info').innerHTML = processHtml;
-                });
+                .then(updateProcesses);
             
             // 次回のデータ更新をスケジュール
             refreshTimer = setTimeout(fetchAndUpdateData, refreshInterval);
         }
+        
+        // サーバーからのプッシュ配信を受信（使えない場合はポーリング）
+        function startStream() {
+            if (!window.EventSource) {
+                fetchAndUpdateData();
+                return;
+            }
+            const source = new EventSource('/api/stream');
+            streaming = true;
+            source.onmessage = function(event) {
+                const data = JSON.parse(event.data);
+                if (data.error) {
+                    showError(data.error);
+                    return;
+                }
+                updateSystemInfo(data.system_info);
+                updateResources(data.resources);
+                updateProcesses(data.processes);
+            };
+            source.onerror = function() {
+                // 自動再接続されずに閉じた場合のみポーリングに切り替える
+                if (source.readyState === EventSource.CLOSED) {
+                    streaming = false;
+                    fetchAndUpdateData();
+                }
+            };
+        }
+        
+        // 全サーバーの要約を取得（サーバー側で集計済みのものを読むだけ）
+        function fetchFleet() {
+            fetch('/api/fleet')
+                .then(response => response.json())
+                .then(updateFleet)
+                .finally(() => setTimeout(fetchFleet, refreshInterval));
+        }
+        
+        // 全サーバーの要約を表示
+        function updateFleet(data) {
+            const labels = { cpu: 'CPU', memory: 'メモリ', disk: 'ディスク' };
+            const format = value => value === null ? '-' : `${value}%`;
+            document.getElementById('fleet-summary').innerHTML = Object.entries(labels).map(([key, label]) => {
+                const summary = data.summary[key];
+                const worst = summary.worst.slice(0, 3).map(item => `${item.ip} (${item.value}%)`).join(', ');
+                return `<div><strong>${label}</strong> 中央値 ${format(summary.p50)} / p90 ${format(summary.p90)} / 最大 ${format(summary.max)}` +
+                    (worst ? ` &mdash; 上位: ${worst}` : '') + '</div>';
+            }).join('');
+            
+            const rowClass = value => value > 90 ? 'table-danger' : value > 70 ? 'table-warning' : '';
+            const fleetInfo = document.getElementById('fleet-info');
+            if (data.hosts.length === 0) {
+                fleetInfo.innerHTML = '<tr><td colspan="5">サーバーが見つかりません</td></tr>';
+                return;
+            }
+            // ホスト名・マウントポイント・エラー文はネットワーク越しに得た値なので textContent で入れる
+            fleetInfo.innerHTML = '';
+            data.hosts.forEach(host => {
+                const worst = Math.max(host.cpu || 0, host.memory || 0, host.disk || 0);
+                const tr = document.createElement('tr');
+                tr.className = rowClass(worst);
+                [
+                    `${host.hostname} (${host.ip})`,
+                    format(host.cpu),
+                    format(host.memory),
+                    format(host.disk) + (host.disk_mountpoint ? ' ' + host.disk_mountpoint : ''),
+                    host.error || 'OK'
+                ].forEach(text => {
+                    const td = document.createElement('td');
+                    td.textContent = text;
+                    tr.appendChild(td);
+                });
+                fleetInfo.appendChild(tr);
+            });
+        }
+        
+        // エージェントに接続できないなどのエラーを表示
+        function showError(message) {
+            document.getElementById('refresh-time').textContent = `取得できません: ${message}`;
+        }
+        
+        // システム情報を表示
+        function updateSystemInfo(data) {
+            if (data.error) {
+                return;
+            }
+            let html = '';
+            for (const [key, value] of Object.entries(data)) {
+                html += `<tr><td>${key}:</td><td>${value}</td></tr>`;
+            }
+            document.getElementById('system-info').innerHTML = html;
+        }
+        
+        // リソース情報を表示
+        function updateResources(data) {
+            if (data.error) {
+                showError(data.error);
+                return;
+            }
+            // 更新時間
+            document.getElementById('refresh-time').textContent = data.time;
+            
+            // CPU情報
+            const cpuPercent = data.cpu.percent;
+            document.getElementById('cpu-percent').textContent = `${cpuPercent}%`;
+            const cpuProgress = document.getElementById('cpu-progress');
+            cpuProgress.style.width = `${cpuPercent}%`;
+            
+            if (cpuPercent > 90) {
+                cpuProgress.className = 'progress-bar bg-danger';
+            } else if (cpuPercent > 70) {
+                cpuProgress.className = 'progress-bar bg-warning';
+            } else {
+                cpuProgress.className = 'progress-bar bg-success';
+            }
+            
+            // メモリ情報
+            const memPercent = data.memory.percent;
+            document.getElementById('memory-percent').textContent = `${memPercent}%`;
+            const memProgress = document.getElementById('memory-progress');
+            memProgress.style.width = `${memPercent}%`;
+            
+            if (memPercent > 90) {
+                memProgress.className = 'progress-bar bg-danger';
+            } else if (memPercent > 70) {
+                memProgress.className = 'progress-bar bg-warning';
+            } else {
+                memProgress.className = 'progress-bar bg-success';
+            }
+            
+            document.getElementById('memory-details').textContent = 
+                `合計: ${data.memory.total} | 使用中: ${data.memory.used} | 利用可能: ${data.memory.available}`;
+            
+            // ディスク情報
+            let diskHtml = '';
+            data.disk.forEach(disk => {
+                let rowClass = '';
+                if (disk.percent > 90) {
+                    rowClass = 'table-danger';
+                } else if (disk.percent > 70) {
+                    rowClass = 'table-warning';
+                }
+                
+                diskHtml += `
+                    <tr class="${rowClass}">
+                        <td>${disk.device}</td>
+                        <td>${disk.mountpoint}</td>
+                        <td>${disk.fstype}</td>
+                        <td>${disk.total}</td>
+                        <td>${disk.used}</td>
+                        <td>${disk.free}</td>
+                        <td>
+                            <div class="d-flex align-items-center">
+                                <div class="progress flex-grow-1" style="height: 5px;">
+                                    <div class="progress-bar ${disk.percent > 90 ? 'bg-danger' : disk.percent > 70 ? 'bg-warning' : 'bg-success'}" 
+                                        role="progressbar" style="width: ${disk.percent}%"></div>
+                                </div>
+                                <span class="ms-2">${disk.percent}%</span>
+                            </div>
+                        </td>
+                    </tr>
+                `;
+            });
+            document.getElementById('disk-info').innerHTML = diskHtml;
+        }
+        
+        // プロセス情報を表示
+        function updateProcesses(data) {
+            if (data.error) {
+                return;
+            }
+            let processHtml = '';
+            data.forEach(process => {
+                processHtml += `
+                    <tr>
+                        <td>${process.pid}</td>
+                        <td>${process.name}</td>
+                        <td>${process.username}</td>
+                        <td>${process.cpu_percent.toFixed(1)}%</td>
+                        <td>${process.memory_percent}%</td>
+                    </tr>
+                `;
+            });
+            document.getElementById('process-info').innerHTML = processHtml;
+        }
     </script>
 </body>
 </html>
     '''
+
+def prepare_dashboard():
+    """設定を読み込み、テンプレートを書き出して、スキャンとフリートの取得を開始する"""
+    # 設定を読み込む
+    load_config()
+    
+    # テンプレートディレクトリを作成
+    os.makedirs('templates', exist_ok=True)
     
     # テンプレートファイルを保存
     with open('templates/index.html', 'w') as f:
-        f.write(html_template)
+        f.write(HTML_TEMPLATE)
     
-    # 最初のネットワークスキャンを開始
+    # 最初のネットワークスキャンと、以降の定期確認を開始
     print('初期ネットワークスキャンを開始中...')
-    scan_thread = threading.Thread(target=scan_network)
-    scan_thread.daemon = True
-    scan_thread.start()
+    scan_manager.start()
+    
+    # 画面を開いていなくてもアラートを評価できるよう、全サーバーの取得を開始
+    fleet_poller.start()
+
+# serve.py から呼ばれるフック（終了の開始時に配信中のストリームを終わらせ、最後に未書き出しの設定を書く）
+def stop_worker():
+    broadcaster.close()
+
+def close_worker():
+    config_writer.flush()
+    host_journal.flush()
+
+if __name__ == '__main__':
+    prepare_dashboard()
     
     print('サーバー監視アプリを起動します...')
     print('ブラウザで http://localhost:5000 にアクセスしてください')
@@ -0,0 +1,77 @@
+import struct
+from multiprocessing import shared_memory
+
+from serialization import loads
+
+# 先頭に置く公開済みの版数と、書き込み先ごとの先頭に置くデータ長
+SEQUENCE = struct.Struct('<Q')
+LENGTH = struct.Struct('<Q')
+
+# 書き込み先1つあたりの容量（バイト）。共有メモリは書いたページだけが実際に使われる
+DEFAULT_CAPACITY = 8 * 1024 * 1024
+
+
+class SharedSnapshot:
+    """収集プロセスが書き、各ワーカープロセスがロックなしで読むエンコード済みスナップショット
+
+    共有メモリ上に書き込み先を2つ持つダブルバッファで、先頭の版数の偶奇が公開中の側を示す。
+    書き手は公開中でない側に書いてから版数を1つ進める（書き手は1プロセスだけ）。
+    読み手は版数を読み、共有メモリ上のバイト列をコピーせずにそのままデコードし、
+    読み終えた時点で版数が変わっていなければその内容を使う。版数が1つでも進んでいれば、
+    書き手は読んでいた側に次の版を書き始めている可能性があるので、新しい版を読み直す。
+    書き手は1秒に1回程度しか公開しないので、読み直しはまず起きない。
+    fork する前に作り、子プロセスには同じマッピングを引き継がせる。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=SEQUENCE.size + 2 * (LENGTH.size + capacity))
+        self._buf = self._shm.buf
+        SEQUENCE.pack_into(self._buf, 0, 0)
+
+    def _offset(self, sequence):
+        return SEQUENCE.size + (sequence % 2) * (LENGTH.size + self.capacity)
+
+    def sequence(self):
+        return SEQUENCE.unpack_from(self._buf, 0)[0]
+
+    def publish(self, data):
+        if len(data) > self.capacity:
+            raise ValueError(f"スナップショット（{len(data)} バイト）が共有メモリの容量（{self.capacity} バイト）を超えています")
+        sequence = self.sequence() + 1
+        offset = self._offset(sequence)
+        start = offset + LENGTH.size
+        LENGTH.pack_into(self._buf, offset, len(data))
+        self._buf[start:start + len(data)] = data
+        # 書き終えてから版数を進めて公開する
+        SEQUENCE.pack_into(self._buf, 0, sequence)
+
+    def read(self, token=None, decode=loads):
+        """(版数, デコードした内容) を返す。まだ公開されていないか token から変わっていなければ内容は None"""
+        while True:
+            sequence = self.sequence()
+            if sequence == 0 or sequence == token:
+                return token, None
+            offset = self._offset(sequence)
+            length = LENGTH.unpack_from(self._buf, offset)[0]
+            start = offset + LENGTH.size
+            view = self._buf[start:start + min(length, self.capacity)]
+            error = None
+            try:
+                value = decode(view)
+            except ValueError as e:
+                value, error = None, e
+            finally:
+                view.release()
+            if self.sequence() == sequence:
+                if error is not None:
+                    raise error
+                return sequence, value
+            # 読んでいる間に公開が進んだ（読んでいた側が書き換えられた可能性がある）ので読み直す
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
@@ -0,0 +1,85 @@
+import threading
+
+from flask import Response
+
+from serialization import dumps
+
+
+def encode_event(data):
+    """Server-Sent Events の1メッセージ分のバイト列を作る"""
+    return b'data: ' + dumps(data) + b'\n\n'
+
+
+class SnapshotBroadcaster:
+    """最新のスナップショットを全購読者にプッシュ配信する
+
+    スナップショットは1周期につき一度だけエンコードし、同じバイト列を全購読者で共有する。
+    購読者がいない間はエンコード自体を行わない。
+    """
+
+    def __init__(self, keepalive=15.0, encoder=encode_event):
+        self.keepalive = keepalive
+        self.encoder = encoder
+        self.subscribers = 0
+        self._cond = threading.Condition()
+        self._data = None
+        self._message = None
+        self._seq = 0
+        self._closed = False
+
+    def close(self):
+        """購読中のストリームをすべて終わらせる（終了時用）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def publish(self, data):
+        with self._cond:
+            self._data = data
+            self._message = self.encoder(data) if self.subscribers else None
+            self._seq += 1
+            self._cond.notify_all()
+
+    def _current_message(self):
+        # 購読者がいない間に更新された分はここで一度だけエンコードする
+        if self._message is None and self._data is not None:
+            self._message = self.encoder(self._data)
+        return self._message
+
+    def subscribe(self):
+        """配信メッセージを順に返すジェネレータ（接続が切れるまで続く）"""
+        with self._cond:
+            self.subscribers += 1
+            seq = self._seq
+            message = self._current_message()
+        try:
+            # 接続直後に最新のスナップショットを送る
+            if message is not None:
+                yield message
+            while True:
+                with self._cond:
+                    if self._seq == seq and not self._closed:
+                        self._cond.wait(self.keepalive)
+                    if self._closed:
+                        return
+                    if self._seq == seq:
+                        message = b': keepalive\n\n'
+                    else:
+                        seq = self._seq
+                        message = self._current_message()
+                yield message
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+def event_stream_response(broadcaster):
+    """購読者1人分の text/event-stream レスポンスを返す"""
+    return Response(
+        broadcaster.subscribe(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        },
+    )